@@ -0,0 +1,511 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import lru_cache
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
+
+from config import CONFIG
+from conversation import ConversationState, as_conversation_state
+from end_rules import LocalEndClassifier, log_decision
+from instrumentation import METRICS
+from json_extract import JSONStreamParser, extract_json
+from prompts import PromptSet, get_prompts
+from schemas import GroupSituation, Report, Situation, field_types, validate
+
+# Поля ситуации и их описание для JSON-шаблона в промпте
+SITUATION_FIELDS = {
+    "situation": '"описание ситуации"',
+    "manager_role": '"роль менеджера"',
+    "client_role": '"роль клиента"',
+    "manager_goal": '"цель менеджера"',
+    "client_concerns": '"основные возражения клиента"',
+    "product": '"продукт или услуга"',
+    "context": '"дополнительный контекст"'
+}
+
+# Поля ситуации групповых переговоров: к обычным добавляются участники со стороны клиента
+GROUP_SITUATION_FIELDS = dict(
+    SITUATION_FIELDS,
+    stakeholders='[{"role": "должность участника", "concerns": "его интересы и возражения"}]'
+)
+
+# Участники со стороны клиента для ситуации по умолчанию
+DEFAULT_STAKEHOLDERS = [
+    {"role": "Финансовый директор", "concerns": "Стоимость внедрения и срок окупаемости"},
+    {"role": "Технический директор", "concerns": "Интеграция с текущими системами и нагрузка на ИТ-отдел"},
+    {"role": "Руководитель отдела закупок", "concerns": "Условия договора, сроки поставки и скидки"},
+    {"role": "Руководитель отдела продаж", "concerns": "Удобство для менеджеров и сроки обучения"}
+]
+
+def json_template(descriptions: Dict[str, str], names: List[str]) -> str:
+    """JSON-шаблон с описанием полей для промпта"""
+    body = ",\n".join(f'    "{name}": {descriptions[name]}' for name in names)
+    return "{\n" + body + "\n}"
+
+def collect_json(chunks: Iterator[Any]) -> Tuple[str, Optional[Dict[str, Any]]]:
+    """Читает поток ответа модели, разбирая JSON по мере поступления фрагментов"""
+    parser = JSONStreamParser()
+    parts, data = [], None
+    for chunk in chunks:
+        parts.append(chunk.content)
+        for obj in parser.feed(chunk.content):
+            data = data or obj
+    return "".join(parts), data
+
+def repair_messages(messages: List[BaseMessage], response_text: str, missing: List[str],
+                    descriptions: Dict[str, str], prompts: Optional[PromptSet] = None) -> List[BaseMessage]:
+    """Сообщения для точечного запроса недостающих полей"""
+    repair_prompt = (prompts or get_prompts()).render(
+        "repair", "user", missing=", ".join(missing), fields_json=json_template(descriptions, missing)
+    )
+    return messages + [AIMessage(content=response_text), HumanMessage(content=repair_prompt)]
+
+def json_validator(schema) -> Callable[[str], bool]:
+    """Проверка ответа модели для кэша: JSON-объект, поля которого соответствуют схеме.
+
+    Агенты запрашивают у модели и части схемы, поэтому проверяются только те поля
+    схемы, которые есть в ответе, но хотя бы одно должно быть.
+    """
+    names = set(field_types(schema))
+    
+    def is_valid(text: str) -> bool:
+        data = extract_json(text)
+        if not isinstance(data, dict):
+            return False
+        present = [name for name in data if name in names]
+        return bool(present) and not validate(data, schema, present)[1]
+    
+    return is_valid
+
+class JSONResponseAgent:
+    """Базовый агент, получающий от модели JSON по схеме.
+    
+    JSON разбирается по мере поступления ответа. Если после разбора не хватает полей,
+    модели отправляется один точечный запрос на их дозаполнение; что не удалось
+    получить и после него, берется из результата по умолчанию. Агент без результата
+    по умолчанию (_default возвращает None) в этом случае сообщает об ошибке.
+    """
+    
+    agent_name = ""
+    schema = None
+    descriptions: Dict[str, str] = {}
+    prompts: PromptSet
+    
+    def _default(self) -> Optional[Dict[str, Any]]:
+        return None
+    
+    def _validate(self, data: Optional[Dict[str, Any]], required: List[str]) -> Tuple[Dict[str, Any], List[str]]:
+        if data is None:
+            METRICS.record_parse_failure(self.agent_name)
+        return validate(data or {}, self.schema, required)
+    
+    def _finish(self, valid: Dict[str, Any], missing: List[str], repaired: Optional[Dict[str, Any]],
+                required: List[str]) -> Dict[str, Any]:
+        repaired_valid, missing = validate(repaired or {}, self.schema, missing)
+        valid.update(repaired_valid)
+        if missing:
+            default = self._default()
+            if default is None:
+                raise ValueError(f"Модель не вернула поля: {', '.join(missing)}")
+            METRICS.record_fallback(self.agent_name)
+            valid.update({name: default[name] for name in missing})
+        return {name: valid[name] for name in required}
+    
+    def _request_json(self, messages: List[BaseMessage], required: List[str]) -> Dict[str, Any]:
+        text, data = collect_json(self.llm.stream(messages))
+        valid, missing = self._validate(data, required)
+        repaired = None
+        if missing:
+            response = self.llm.invoke(repair_messages(messages, text, missing, self.descriptions, self.prompts))
+            repaired = extract_json(response.content)
+        return self._finish(valid, missing, repaired, required)
+
+class SituationGenerator(JSONResponseAgent):
+    """Агент для создания ситуаций и ролей"""
+    
+    agent_name = "situation"
+    schema = Situation
+    descriptions = SITUATION_FIELDS
+    
+    def __init__(self, llm, stakeholders: int = 0, prompts: Optional[PromptSet] = None):
+        self.llm = llm
+        self.prompts = prompts or get_prompts()
+        # Число участников со стороны клиента в групповых переговорах (0 - один клиент)
+        self.stakeholders = stakeholders
+        if stakeholders:
+            self.schema = GroupSituation
+            self.descriptions = GROUP_SITUATION_FIELDS
+    
+    def _build_messages(self) -> List[BaseMessage]:
+        """Формирует сообщения для генерации ситуации"""
+        group = self.prompts.render("situation", "group", stakeholders=self.stakeholders) if self.stakeholders else ""
+        return self.prompts.messages(
+            "situation", system_extra=group, fields_json=json_template(self.descriptions, list(self.descriptions))
+        )
+    
+    def _limit(self, situation: Dict[str, Any]) -> Dict[str, Any]:
+        """Оставляет заданное число участников; роль подписывает реплики, поэтому повторы отбрасываются"""
+        if self.stakeholders:
+            unique: Dict[str, Dict[str, str]] = {}
+            for stakeholder in situation["stakeholders"]:
+                unique.setdefault(stakeholder["role"], stakeholder)
+            situation["stakeholders"] = list(unique.values())[:self.stakeholders]
+        return situation
+    
+    def generate_situation(self) -> Dict[str, str]:
+        """Генерирует случайную ситуацию для переговоров"""
+        return self._limit(self._request_json(self._build_messages(), list(self.descriptions)))
+    
+    def _default(self) -> Dict[str, Any]:
+        situation = self._create_default_situation()
+        if self.stakeholders:
+            situation["stakeholders"] = [dict(stakeholder) for stakeholder in DEFAULT_STAKEHOLDERS]
+        return situation
+    
+    def _create_default_situation(self) -> Dict[str, str]:
+        return {
+            "situation": "Переговоры по внедрению CRM-системы в среднюю компанию",
+            "manager_role": "Менеджер по продажам IT-решений",
+            "client_role": "Директор по развитию компании",
+            "manager_goal": "Продать CRM-систему стоимостью 500,000 рублей",
+            "client_concerns": "Высокая стоимость, сложность внедрения, сомнения в ROI",
+            "product": "CRM-система для автоматизации продаж",
+            "context": "Клиент уже использует простую систему учета, но хочет масштабировать бизнес"
+        }
+
+class HistorySummarizer:
+    """Агент для сворачивания ранней части диалога в краткое резюме"""
+    
+    def __init__(self, llm, prompts: Optional[PromptSet] = None):
+        self.llm = llm
+        self.prompts = prompts or get_prompts()
+    
+    def summarize(self, previous_summary: str, history_text: str) -> str:
+        """Дополняет резюме диалога новыми репликами"""
+        messages = self.prompts.messages(
+            "summarizer", previous_summary=previous_summary or "Пока пусто", history_text=history_text
+        )
+        response = self.llm.invoke(messages)
+        return response.content.strip()
+
+class DialogueAgent:
+    """Агент для ведения диалога от имени клиента"""
+    
+    def __init__(self, llm, situation: Dict[str, str], prompts: Optional[PromptSet] = None):
+        self.llm = llm
+        self.situation = situation
+        self.prompts = prompts or get_prompts()
+    
+    def _build_messages(self, conversation_history: List[Dict[str, str]]) -> List[BaseMessage]:
+        """Формирует сообщения для ответа клиента на основе истории диалога"""
+        return self.prompts.messages(
+            "client",
+            client_role=self.situation['client_role'],
+            situation=self.situation['situation'],
+            client_concerns=self.situation['client_concerns'],
+            # История диалога берется из кэшированной стенограммы
+            history_text=as_conversation_state(conversation_history).context()
+        )
+    
+    def respond_as_client(self, conversation_history: List[Dict[str, str]]) -> str:
+        """Отвечает от имени клиента на основе истории диалога"""
+        response = self.llm.invoke(self._build_messages(conversation_history))
+        return response.content.strip()
+    
+    def stream_as_client(self, conversation_history: List[Dict[str, str]]) -> Iterator[str]:
+        """Отвечает от имени клиента, отдавая ответ по частям по мере генерации"""
+        for chunk in self.llm.stream(self._build_messages(conversation_history)):
+            if chunk.content:
+                yield chunk.content
+
+def previous_replies(conversation_history) -> List[Dict[str, str]]:
+    """Ответы клиента на предпоследнюю реплику менеджера - предыдущий ход группы"""
+    replies: List[Dict[str, str]] = []
+    managers = 0
+    for i in range(len(conversation_history) - 1, -1, -1):
+        msg = conversation_history[i]
+        if msg['role'] == 'manager':
+            managers += 1
+            if managers == 2:
+                break
+        elif managers == 1:
+            replies.append(msg)
+    return replies[::-1]
+
+class StakeholderAgent:
+    """Агент одного участника групповых переговоров со своей памятью диалога.
+    
+    В память участника попадают только реплики менеджера и его собственные ответы,
+    поэтому промпт не растет от реплик остальных участников: из них участник видит
+    только ответы предыдущего хода. Ранняя часть памяти сворачивается в личное резюме.
+    """
+    
+    def __init__(self, llm, situation: Dict[str, Any], stakeholder: Dict[str, str], colleagues: List[str],
+                 context_messages: int = 0, summarizer=None, prompts: Optional[PromptSet] = None):
+        self.llm = llm
+        self.prompts = prompts or get_prompts()
+        self.situation = situation
+        self.stakeholder = stakeholder
+        self.name = stakeholder['role']
+        self.colleagues = colleagues
+        self.memory = ConversationState(context_messages=context_messages, summarizer=summarizer)
+        self._seen = 0  # Сколько сообщений общей истории уже просмотрено
+    
+    def sync(self, conversation_history) -> None:
+        """Переносит в память новые реплики менеджера и собственные ответы участника"""
+        new_messages = conversation_history[self._seen:]
+        self._seen += len(new_messages)
+        self.memory.extend(
+            msg for msg in new_messages if msg['role'] == 'manager' or msg.get('speaker') == self.name
+        )
+    
+    def _build_messages(self, conversation_history) -> List[BaseMessage]:
+        """Формирует сообщения для ответа участника на последнюю реплику менеджера"""
+        self.sync(conversation_history)
+        colleagues_text = "".join(
+            f"{msg['speaker']}: {msg['content']}\n"
+            for msg in previous_replies(conversation_history) if msg.get('speaker') != self.name
+        )
+        return self.prompts.messages(
+            "stakeholder",
+            role=self.name,
+            situation=self.situation['situation'],
+            concerns=self.stakeholder.get('concerns', self.situation['client_concerns']),
+            colleagues=", ".join(self.colleagues),
+            history_text=self.memory.context(),
+            colleagues_text=colleagues_text or "Пока ничего"
+        )
+    
+    def respond(self, conversation_history) -> str:
+        """Ответ участника на последнюю реплику менеджера"""
+        response = self.llm.invoke(self._build_messages(conversation_history))
+        return response.content.strip()
+
+class GroupDialogueAgent:
+    """Агент групповых переговоров: по агенту на каждого участника со стороны клиента.
+    
+    Участники отвечают на реплику менеджера одновременно, поэтому задержка хода
+    определяется самым медленным из них, а не суммой. Ответы добавляются в историю
+    в порядке участников в ситуации. Ошибка одного участника не прерывает ход:
+    ответы остальных сохраняются, а ошибка пробрасывается, только если не ответил никто.
+    """
+    
+    def __init__(self, llm, situation: Dict[str, Any], context_messages: int = 0, summarizer=None,
+                 prompts: Optional[PromptSet] = None):
+        self.situation = situation
+        names = [stakeholder['role'] for stakeholder in situation['stakeholders']]
+        self.personas = [
+            StakeholderAgent(
+                llm, situation, stakeholder, [other for other in names if other != stakeholder['role']],
+                context_messages=context_messages, summarizer=summarizer, prompts=prompts
+            )
+            for stakeholder in situation['stakeholders']
+        ]
+    
+    def _reply(self, index: int, content: str) -> Dict[str, str]:
+        return {'role': 'client', 'speaker': self.personas[index].name, 'content': content}
+    
+    def _answered(self, replies: List[Optional[Dict[str, str]]], errors: List[BaseException]) -> List[Dict[str, str]]:
+        answered = [reply for reply in replies if reply is not None]
+        if errors and not answered:
+            raise errors[0]
+        return answered
+    
+    def iter_responses(self, conversation_history
+                       ) -> Iterator[Tuple[int, Optional[Dict[str, str]], Optional[Exception]]]:
+        """Ответы участников по мере готовности: (номер участника, сообщение, ошибка).
+        
+        Для участника, который не смог ответить, вместо сообщения возвращается ошибка.
+        """
+        with ThreadPoolExecutor(max_workers=len(self.personas)) as pool:
+            futures = {
+                pool.submit(persona.respond, conversation_history): index
+                for index, persona in enumerate(self.personas)
+            }
+            for future in as_completed(futures):
+                index = futures[future]
+                try:
+                    content = future.result()
+                except Exception as exc:
+                    yield index, None, exc
+                else:
+                    yield index, self._reply(index, content), None
+    
+    def respond(self, conversation_history) -> List[Dict[str, str]]:
+        """Ответы участников в порядке ситуации; не ответившие участники пропускаются"""
+        replies: List[Optional[Dict[str, str]]] = [None] * len(self.personas)
+        errors = []
+        for index, reply, error in self.iter_responses(conversation_history):
+            replies[index] = reply
+            if error is not None:
+                errors.append(error)
+        return self._answered(replies, errors)
+
+class DialogueEndDetector:
+    """Агент для определения завершения диалога.
+    
+    Сначала решение принимает локальный классификатор; модель вызывается, только если
+    его уверенность ниже порога или подошла периодическая проверка раз в llm_every_n ходов.
+    """
+    
+    def __init__(self, llm, situation: Dict[str, str], classifier: Optional[LocalEndClassifier] = None,
+                 confidence_threshold: float = 0.8, llm_every_n: int = 0, decision_log: Optional[str] = None,
+                 prompts: Optional[PromptSet] = None):
+        self.llm = llm
+        self.situation = situation
+        self.prompts = prompts or get_prompts()
+        self.classifier = classifier or LocalEndClassifier()
+        self.confidence_threshold = confidence_threshold
+        self.llm_every_n = llm_every_n
+        self.decision_log = decision_log
+        self.checks = 0
+        self.llm_calls = 0
+        self._checks_since_llm = 0
+    
+    @property
+    def skip_rate(self) -> float:
+        """Доля проверок, решенных без обращения к модели"""
+        return 1 - self.llm_calls / self.checks if self.checks else 0.0
+    
+    def _build_messages(self, conversation_history: List[Dict[str, str]]) -> List[BaseMessage]:
+        """Формирует сообщения для проверки завершения диалога"""
+        return self.prompts.messages(
+            "end_check",
+            manager_goal=self.situation['manager_goal'],
+            history_text=as_conversation_state(conversation_history).context()
+        )
+    
+    def local_decision(self, conversation_history: List[Dict[str, str]]) -> Optional[bool]:
+        """Решение локальной стадии; None означает, что нужна проверка моделью"""
+        if len(conversation_history) < 4:  # Минимум 4 сообщения
+            return False
+        
+        self.checks += 1
+        self._checks_since_llm += 1
+        decision, confidence = self.classifier.classify(conversation_history)
+        periodic = self.llm_every_n and self._checks_since_llm >= self.llm_every_n
+        if confidence >= self.confidence_threshold and not periodic:
+            return decision
+        return None
+    
+    def _llm_result(self, conversation_history: List[Dict[str, str]], content: str) -> bool:
+        self.llm_calls += 1
+        self._checks_since_llm = 0
+        decision = "ДА" in content.upper()
+        if self.decision_log:
+            log_decision(self.decision_log, conversation_history, decision)
+        return decision
+    
+    def llm_decision(self, conversation_history: List[Dict[str, str]]) -> bool:
+        """Проверка завершения моделью"""
+        response = self.llm.invoke(self._build_messages(conversation_history))
+        return self._llm_result(conversation_history, response.content)
+    
+    def should_end_dialogue(self, conversation_history: List[Dict[str, str]]) -> bool:
+        """Определяет, пора ли завершить диалог"""
+        decision = self.local_decision(conversation_history)
+        if decision is not None:
+            return decision
+        return self.llm_decision(conversation_history)
+
+@lru_cache(maxsize=1)
+def get_end_classifier() -> LocalEndClassifier:
+    """Локальный классификатор завершения диалога, общий для всех сессий процесса"""
+    return LocalEndClassifier(CONFIG.get("end_detection", {}).get("model_path"))
+
+def new_end_detector(llm, situation: Dict[str, str], log_decisions: bool = True) -> DialogueEndDetector:
+    """Создает детектор завершения с настройками из конфигурации.
+
+    log_decisions=False не пишет решения модели в журнал обучения классификатора,
+    например для синтетических диалогов симулятора.
+    """
+    end_config = CONFIG.get("end_detection", {})
+    return DialogueEndDetector(
+        llm,
+        situation,
+        classifier=get_end_classifier(),
+        confidence_threshold=end_config.get("confidence_threshold", 0.8),
+        llm_every_n=end_config.get("llm_every_n", 0),
+        decision_log=end_config.get("decision_log") if log_decisions else None
+    )
+
+# Поля отчета и их описание для JSON-шаблона в промпте
+REPORT_FIELDS = {
+    "summary": '"краткое резюме переговоров"',
+    "strengths": '["сильные стороны менеджера"]',
+    "weaknesses": '["слабые стороны и ошибки"]',
+    "recommendations": '["конкретные рекомендации по улучшению"]',
+    "growth_areas": '["области для развития"]',
+    "techniques_used": '["использованные техники"]',
+    "missed_opportunities": '["упущенные возможности"]',
+    "overall_rating": '"общая оценка от 1 до 10"'
+}
+
+# Проверка ответов агентов с JSON перед записью в кэш ответов
+RESPONSE_VALIDATORS = {
+    "situation": json_validator(GroupSituation),
+    "report": json_validator(Report)
+}
+
+# Части отчета, которые запрашиваются у модели независимо и параллельно
+REPORT_PARTS = {
+    "assessment": ["summary", "strengths", "weaknesses", "techniques_used", "overall_rating"],
+    "development": ["recommendations", "growth_areas", "missed_opportunities"]
+}
+
+class ReportGenerator(JSONResponseAgent):
+    """Агент для создания отчета по результатам переговоров"""
+    
+    agent_name = "report"
+    schema = Report
+    descriptions = REPORT_FIELDS
+    
+    def __init__(self, llm, situation: Dict[str, str], prompts: Optional[PromptSet] = None):
+        self.llm = llm
+        self.situation = situation
+        self.prompts = prompts or get_prompts()
+    
+    def _build_messages(self, conversation_history: List[Dict[str, str]], fields: List[str]) -> List[BaseMessage]:
+        """Формирует сообщения для запроса указанных полей отчета"""
+        # Извлекаем только сообщения менеджера
+        manager_messages = [msg['content'] for msg in conversation_history if msg['role'] == 'manager']
+        manager_text = "\n".join([f"Сообщение {i+1}: {msg}" for i, msg in enumerate(manager_messages)])
+        
+        return self.prompts.messages(
+            "report",
+            situation=self.situation['situation'],
+            manager_goal=self.situation['manager_goal'],
+            product=self.situation['product'],
+            manager_text=manager_text,
+            fields_json=json_template(REPORT_FIELDS, fields)
+        )
+    
+    def generate_report_part(self, conversation_history: List[Dict[str, str]], part: str) -> Dict[str, Any]:
+        """Генерирует одну часть отчета из REPORT_PARTS.
+        
+        Если модель не вернула все поля части даже после повторного запроса, бросает ValueError.
+        """
+        fields = REPORT_PARTS[part]
+        return self._request_json(self._build_messages(conversation_history, fields), fields)
+    
+    def assemble_report(self, parts: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Собирает части в отчет с привычным порядком полей.
+        
+        Отчет без какой-либо части не собирается: подставлять вместо нее отчет
+        по умолчанию нельзя, иначе стажер получит выдуманную оценку.
+        """
+        report = {}
+        for part in parts:
+            report.update(part)
+        missing = [field for field in REPORT_FIELDS if field not in report]
+        if missing:
+            raise ValueError(f"В отчете нет полей: {', '.join(missing)}")
+        return {field: report[field] for field in REPORT_FIELDS}
+    
+    def generate_report(self, conversation_history: List[Dict[str, str]]) -> Dict[str, Any]:
+        """Генерирует подробный отчет по переговорам, запрашивая части отчета параллельно"""
+        with ThreadPoolExecutor(max_workers=len(REPORT_PARTS)) as pool:
+            parts = list(pool.map(
+                lambda part: self.generate_report_part(conversation_history, part), REPORT_PARTS
+            ))
+        return self.assemble_report(parts)
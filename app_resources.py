@@ -0,0 +1,275 @@
+"""Общие для процесса ресурсы приложения: клиенты моделей, шлюз, кэши и хранилища.
+
+Модуль импортируется один раз на процесс, а не при каждой перерисовке страницы
+Streamlit. Тяжелые зависимости (клиент GigaChat, python-docx, pandas) загружаются
+при первом обращении к ресурсу, которому они нужны.
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Optional, Union
+
+import streamlit as st
+
+from agents import (RESPONSE_VALIDATORS, DialogueAgent, DialogueEndDetector, GroupDialogueAgent, HistorySummarizer,
+                    ReportGenerator, SituationGenerator, new_end_detector)
+from config import CONFIG
+from conversation import ConversationState
+from cohort_analytics import CohortAnalytics
+from instrumentation import METRICS, InstrumentedLLM, configure_call_log, model_name, start_metrics_server
+from llm_gateway import LLMGateway
+from model_router import ModelRouter, RoutedLLM
+from report_export import RenderCache
+from report_jobs import ReportJobManager
+from response_cache import POLICY_NEVER, CachedLLM, ResponseCache
+from session_store import ActiveSessions, SessionStore, SQLiteSessionStore
+from situation_pool import SituationPool
+
+@st.cache_resource
+def get_llm(model: str, timeout: Optional[float] = None, max_tokens: Optional[int] = None,
+            temperature: Optional[float] = None):
+    """Клиент GigaChat для модели с заданными параметрами, общий для процесса"""
+    # langchain_community тяжелый, поэтому загружается только при создании первого клиента
+    from langchain_community.chat_models import GigaChat
+
+    llm_config = CONFIG.get("llm", {})
+    # Размер пула соединений клиент gigachat читает из окружения
+    os.environ.setdefault("GIGACHAT_MAX_CONNECTIONS", str(llm_config.get("max_connections", 20)))
+    params = {"timeout": timeout, "max_tokens": max_tokens, "temperature": temperature}
+    return GigaChat(
+        scope='GIGACHAT_API_CORP',
+        credentials=CONFIG["token"]["gigachat"],
+        verify_ssl_certs=False,
+        model=model,
+        **{name: value for name, value in params.items() if value is not None}
+    )
+
+@st.cache_resource
+def get_llm_gateway() -> LLMGateway:
+    """Общий для всех сессий шлюз с ограничением параллелизма и повторами"""
+    llm_config = CONFIG.get("llm", {})
+    return LLMGateway(
+        max_concurrency=llm_config.get("max_concurrency", 8),
+        rate_limit=llm_config.get("rate_limit", 0),
+        burst=llm_config.get("burst", 10),
+        max_retries=llm_config.get("max_retries", 3),
+        backoff_base=llm_config.get("backoff_base", 0.5),
+        backoff_max=llm_config.get("backoff_max", 10),
+        on_retry=lambda llm: METRICS.record_retry(model_name(llm))
+    )
+
+@st.cache_resource
+def get_model_router() -> ModelRouter:
+    """Маршруты агентов по моделям и общие бюджеты задержки этапов"""
+    return ModelRouter.from_config(
+        CONFIG.get("routing", {}),
+        default_model=CONFIG.get("llm", {}).get("model", "GigaChat-2-Max")
+    )
+
+def session_llm(session_id: str, agent: str = "default", model: Optional[str] = None):
+    """Модель агента для сессии согласно маршруту; вызовы идут через общий шлюз.
+
+    Явно заданная model заменяет модель маршрута и отключает запасную модель,
+    например при сравнении моделей в replay.py.
+    """
+    router = get_model_router()
+    route = router.route(agent)
+    gateway = get_llm_gateway()
+    primary = get_llm(model or route.model, **route.client_params())
+    if model or not route.fallback:
+        return gateway.bind(primary, session_id)
+    # Основную модель не повторяем: при 429/5xx запрос сразу уходит на запасную
+    return RoutedLLM(
+        gateway.bind(primary, session_id, max_retries=0),
+        gateway.bind(get_llm(route.fallback, **route.client_params()), session_id),
+        agent,
+        router.budget(agent),
+        on_fallback=METRICS.record_model_fallback
+    )
+
+@st.cache_resource
+def get_response_cache() -> ResponseCache:
+    """Общий для процесса персистентный кэш ответов модели"""
+    cache_config = CONFIG.get("cache", {})
+    return ResponseCache(
+        path=cache_config.get("path", "response_cache.db"),
+        max_entries=cache_config.get("max_entries", 5000),
+        ttl_seconds=cache_config.get("ttl_seconds")
+    )
+
+def agent_llm(session_id: str, agent: str):
+    """Модель агента: маршрут, инструментирование вызовов и кэш ответов согласно политике агента.
+
+    Кэш стоит снаружи инструментирования: ответ из кэша учитывается только в метриках
+    кэша и не искажает задержку и расход токенов модели, по которым строится маршрутизация.
+    """
+    llm = InstrumentedLLM(session_llm(session_id, agent), agent)
+    cache_config = CONFIG.get("cache", {})
+    policy = cache_config.get("policies", {}).get(agent, POLICY_NEVER)
+    if policy != POLICY_NEVER:
+        llm = CachedLLM(
+            llm, get_response_cache(), agent, policy, cache_config.get("samples", 20),
+            validator=RESPONSE_VALIDATORS.get(agent)
+        )
+    return llm
+
+# Пул для фоновых вызовов, которые выполняются параллельно с потоковым выводом ответа
+background_executor = ThreadPoolExecutor(max_workers=8)
+
+@st.cache_resource
+def get_situation_pool() -> SituationPool:
+    """Общий для всех сессий пул готовых ситуаций"""
+    pool_config = CONFIG.get("situation_pool", {})
+    return SituationPool(
+        # Пул наполняется свежими ситуациями в обход кэша - повторы он все равно отбросит
+        SituationGenerator(InstrumentedLLM(session_llm("situation-pool", "situation"), "situation")),
+        path=pool_config.get("path", "situation_pool.db"),
+        size=pool_config.get("size", 5),
+        similarity_threshold=pool_config.get("similarity_threshold", 0.6)
+    ).start()
+
+@st.cache_resource
+def get_report_jobs() -> ReportJobManager:
+    """Общая очередь фоновой генерации отчетов"""
+    return ReportJobManager(max_workers=CONFIG.get("reports", {}).get("max_workers", 4))
+
+@st.cache_resource
+def get_render_cache() -> RenderCache:
+    """Готовые файлы отчетов: повторное скачивание не рендерит документ заново"""
+    return RenderCache(CONFIG.get("reports", {}).get("render_cache_size", 200))
+
+@st.cache_resource
+def start_metrics_exporters() -> None:
+    """Один раз на процесс включает журнал вызовов LLM и эндпоинт Prometheus"""
+    metrics_config = CONFIG.get("metrics", {})
+    if metrics_config.get("call_log"):
+        configure_call_log(
+            metrics_config["call_log"],
+            max_bytes=metrics_config.get("call_log_max_bytes", 10 * 1024 * 1024),
+            backup_count=metrics_config.get("call_log_backups", 5)
+        )
+    if metrics_config.get("prometheus_port"):
+        start_metrics_server(metrics_config["prometheus_port"])
+
+def context_messages() -> int:
+    """Сколько последних сообщений передавать модели дословно"""
+    return CONFIG.get("conversation", {}).get("context_messages", 0)
+
+class TrainingSession:
+    """Состояние одной тренировки, сохраняемое в хранилище по мере изменения.
+
+    Каждое сообщение диалога сразу дописывается в журнал сессии, поэтому тренировку
+    можно продолжить по ее идентификатору после обновления страницы или перезапуска сервера.
+    """
+    
+    def __init__(self, session_id: str, store: SessionStore, analytics: Optional[CohortAnalytics] = None):
+        self.session_id = session_id
+        self.store = store
+        self.analytics = analytics
+        self.trainee: Optional[str] = None
+        self.situation: Optional[Dict[str, str]] = None
+        self.dialogue_agent: Optional[Union[DialogueAgent, GroupDialogueAgent]] = None
+        self.end_detector: Optional[DialogueEndDetector] = None
+        self.report_generator: Optional[ReportGenerator] = None
+        self.dialogue_ended = False
+        self.report_data: Optional[Dict[str, Any]] = None
+        # Резюмирующий агент подключается вместе с остальными агентами в начале тренировки,
+        # поэтому открытие страницы без тренировки не создает клиент модели
+        self.conversation_history = ConversationState(
+            context_messages=context_messages(), on_append=self._persist_message
+        )
+    
+    @classmethod
+    def load(cls, session_id: str, store: SessionStore,
+             analytics: Optional[CohortAnalytics] = None) -> "TrainingSession":
+        """Восстанавливает тренировку из хранилища или создает новую"""
+        session = cls(session_id, store, analytics)
+        record = store.load(session_id)
+        if record is None:
+            return session
+        session.conversation_history = ConversationState.restore(
+            record["messages"],
+            summary=record["summary"],
+            summarized=record["summarized"],
+            context_messages=context_messages(),
+            on_append=session._persist_message
+        )
+        if record["situation"]:
+            session._create_agents(record["situation"])
+        session.trainee = record["trainee"]
+        session.dialogue_ended = record["dialogue_ended"]
+        session.report_data = record["report"]
+        return session
+    
+    @property
+    def is_group(self) -> bool:
+        """Групповые переговоры с несколькими участниками со стороны клиента"""
+        return bool(self.situation and self.situation.get("stakeholders"))
+    
+    def _create_agents(self, situation: Dict[str, str]) -> None:
+        self.situation = situation
+        summarizer = HistorySummarizer(agent_llm(self.session_id, "summarizer"))
+        self.conversation_history.summarizer = summarizer
+        # Резюме истории готовится в фоне, не задерживая ответ клиента
+        self.conversation_history.executor = background_executor
+        if self.is_group:
+            # Память участников не сохраняется: после загрузки они заново собирают ее из истории
+            self.dialogue_agent = GroupDialogueAgent(
+                agent_llm(self.session_id, "client"),
+                situation,
+                context_messages=CONFIG.get("group", {}).get("context_messages", 6),
+                summarizer=summarizer
+            )
+        else:
+            self.dialogue_agent = DialogueAgent(agent_llm(self.session_id, "client"), situation)
+        self.end_detector = new_end_detector(agent_llm(self.session_id, "end_check"), situation)
+        self.report_generator = ReportGenerator(agent_llm(self.session_id, "report"), situation)
+    
+    def _persist_message(self, conversation: ConversationState, msg: Dict[str, str]) -> None:
+        self.store.append_message(self.session_id, len(conversation) - 1, msg)
+        if conversation.summary:
+            self.store.save(self.session_id, summary=conversation.summary, summarized=conversation.summarized)
+    
+    def start(self, situation: Dict[str, str]) -> None:
+        """Начинает тренировку по ситуации"""
+        self._create_agents(situation)
+        self.store.save(self.session_id, situation=situation)
+    
+    def end(self) -> None:
+        """Отмечает диалог завершенным"""
+        self.dialogue_ended = True
+        self.store.save(self.session_id, dialogue_ended=True)
+    
+    def set_trainee(self, trainee: str) -> None:
+        self.trainee = trainee
+        self.store.save(self.session_id, trainee=trainee)
+        # Отчет уже в аналитике под прежним именем - перезаписываем его под новым
+        if self.report_data is not None and self.analytics is not None:
+            self.analytics.ingest(self.session_id, self.report_data, trainee)
+    
+    def save_report(self, report_data: Dict[str, Any]) -> None:
+        self.report_data = report_data
+        self.store.save(self.session_id, report=report_data)
+        if self.analytics is not None:
+            self.analytics.ingest(self.session_id, report_data, self.trainee)
+
+@st.cache_resource
+def get_session_store() -> SessionStore:
+    """Общее для процесса хранилище тренировок"""
+    return SQLiteSessionStore(CONFIG.get("sessions", {}).get("path", "sessions.db"))
+
+@st.cache_resource
+def get_cohort_analytics() -> CohortAnalytics:
+    """Общая для процесса аналитика по отчетам группы"""
+    return CohortAnalytics(CONFIG.get("analytics", {}).get("path", "analytics.db"))
+
+@st.cache_resource
+def get_active_sessions() -> ActiveSessions:
+    """Тренировки в памяти процесса; неактивные выгружаются и загружаются из хранилища заново"""
+    sessions_config = CONFIG.get("sessions", {})
+    store = get_session_store()
+    analytics = get_cohort_analytics()
+    return ActiveSessions(
+        lambda session_id: TrainingSession.load(session_id, store, analytics),
+        idle_seconds=sessions_config.get("idle_seconds", 1800),
+        max_sessions=sessions_config.get("max_active", 500)
+    )
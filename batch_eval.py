@@ -0,0 +1,132 @@
+"""Пакетная оценка сохраненных диалогов без интерфейса.
+
+Пример:
+    python batch_eval.py transcripts.jsonl reports.jsonl --workers 8
+    python batch_eval.py transcripts.jsonl reports.jsonl --llm fake_llm:FakeChatModel
+
+Каждая строка входного файла - JSON с полями id, situation и conversation_history.
+Результаты дописываются в выходной файл по мере готовности, поэтому прерванный
+прогон продолжается с того же места: уже оцененные id пропускаются.
+"""
+import argparse
+import importlib
+import json
+import math
+import os
+import sys
+import time
+from concurrent.futures import ALL_COMPLETED, FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Dict, Iterator, List, Optional, Set
+
+from agents import ReportGenerator
+
+def load_llm(spec: str, session_id: str = "batch-eval", agent: str = "report", model: Optional[str] = None):
+    """Создает модель по спецификации "module:factory" или берет GigaChat по маршруту агента.
+
+    model заменяет модель из маршрута агента; фабрике "module:factory" он передается аргументом.
+    """
+    if spec == "gigachat":
+        from app_resources import session_llm
+        return session_llm(session_id, agent, model)
+    module_name, _, attr = spec.partition(":")
+    factory = getattr(importlib.import_module(module_name), attr)
+    return factory(model=model) if model else factory()
+
+def read_transcripts(path: str) -> Iterator[Dict[str, Any]]:
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+def completed_ids(path: str) -> Set[str]:
+    """Идентификаторы диалогов, уже записанных в выходной файл"""
+    if not os.path.exists(path):
+        return set()
+    done = set()
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # Обрезанная последняя строка после аварийной остановки
+                continue
+            if "error" not in record:
+                done.add(str(record["id"]))
+    return done
+
+def percentile(values: List[float], q: float) -> float:
+    """Перцентиль методом ближайшего ранга"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, math.ceil(q / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+def score_transcript(llm, record: Dict[str, Any]) -> Dict[str, Any]:
+    started = time.perf_counter()
+    result: Dict[str, Any] = {"id": record["id"]}
+    try:
+        generator = ReportGenerator(llm, record["situation"])
+        result["report"] = generator.generate_report(record["conversation_history"])
+    except Exception as exc:
+        result["error"] = str(exc)
+    result["latency"] = round(time.perf_counter() - started, 3)
+    return result
+
+def run_batch(input_path: str, output_path: str, llm, workers: int = 4,
+              limit: Optional[int] = None) -> Dict[str, float]:
+    """Оценивает диалоги из input_path и возвращает сводку по пропускной способности"""
+    done = completed_ids(output_path)
+    latencies: List[float] = []
+    errors = 0
+    started = time.perf_counter()
+    pending = set()
+    todo = (record for record in read_transcripts(input_path) if str(record["id"]) not in done)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool, open(output_path, "a", encoding="utf-8") as out:
+        def drain(return_when) -> None:
+            nonlocal pending, errors
+            finished, pending = wait(pending, return_when=return_when)
+            for future in finished:
+                result = future.result()
+                out.write(json.dumps(result, ensure_ascii=False) + "\n")
+                out.flush()
+                latencies.append(result["latency"])
+                errors += "error" in result
+
+        for submitted, record in enumerate(todo):
+            if limit is not None and submitted >= limit:
+                break
+            # Держим в работе не больше двух задач на поток, чтобы не читать весь файл в память
+            if len(pending) >= workers * 2:
+                drain(FIRST_COMPLETED)
+            pending.add(pool.submit(score_transcript, llm, record))
+        if pending:
+            drain(ALL_COMPLETED)
+
+    elapsed = time.perf_counter() - started
+    return {
+        "scored": len(latencies),
+        "skipped": len(done),
+        "errors": errors,
+        "elapsed_seconds": round(elapsed, 2),
+        "transcripts_per_minute": round(len(latencies) / elapsed * 60, 2) if elapsed else 0.0,
+        "latency_p50": percentile(latencies, 50),
+        "latency_p95": percentile(latencies, 95)
+    }
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Пакетная оценка диалогов ReportGenerator")
+    parser.add_argument("input", help="JSONL с диалогами")
+    parser.add_argument("output", help="JSONL с отчетами, служит и контрольной точкой")
+    parser.add_argument("--workers", type=int, default=4, help="число параллельных оценок")
+    parser.add_argument("--llm", default="gigachat", help='"gigachat" или "module:factory"')
+    parser.add_argument("--limit", type=int, help="оценить не больше N диалогов")
+    args = parser.parse_args(argv)
+
+    summary = run_batch(args.input, args.output, load_llm(args.llm), args.workers, args.limit)
+    json.dump(summary, sys.stdout, ensure_ascii=False, indent=2)
+    print()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,6 @@
+"""Воспроизводимые замеры производительности агентов на локальной модели FakeChatModel.
+
+Запуск: python -m benchmarks run [--output results.json]
+Сравнение: python -m benchmarks compare base.json new.json
+Время импорта: python -m benchmarks imports [--budget-ms 900]
+"""
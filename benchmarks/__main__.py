@@ -0,0 +1,72 @@
+import argparse
+import json
+import os
+import sys
+from typing import List, Optional
+
+from benchmarks.cases import CASES, HISTORY_LENGTHS
+from benchmarks.harness import compare, run_suite, save_results
+from benchmarks.imports import measure_import
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description="Замеры производительности агентов")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="прогнать замеры и сохранить результаты в JSON")
+    run.add_argument("--output", help="файл результатов (по умолчанию benchmarks/results/<commit>.json)")
+    run.add_argument("--rounds", type=int, default=5)
+    run.add_argument("--warmup", type=int, default=1)
+    run.add_argument("--lengths", type=int, nargs="+", default=HISTORY_LENGTHS, help="длины диалога")
+    run.add_argument("--latency", type=float, default=0.0, help="задержка фейковой модели, с")
+    run.add_argument("--tokens-per-second", type=float, default=0.0, help="скорость генерации фейковой модели")
+    run.add_argument("--only", nargs="+", choices=list(CASES), help="замерить только указанные этапы")
+
+    cmp_parser = commands.add_parser("compare", help="сравнить два файла результатов")
+    cmp_parser.add_argument("base")
+    cmp_parser.add_argument("new")
+    cmp_parser.add_argument("--threshold", type=float, default=0.1, help="допустимое замедление, доля")
+
+    imports = commands.add_parser("imports", help="проверить время холодного импорта приложения")
+    imports.add_argument("--module", default="negotiation_trainer")
+    imports.add_argument("--budget-ms", type=float, default=900, help="допустимое время импорта, мс")
+    imports.add_argument("--runs", type=int, default=3)
+
+    args = parser.parse_args(argv)
+
+    if args.command == "imports":
+        profile = measure_import(args.module, args.runs)
+        for dependency in profile["heaviest"]:
+            print(f"{dependency['module']:<30} {dependency['ms']:>8.1f} ms")
+        over_budget = profile["total_ms"] > args.budget_ms
+        print(f"{profile['module']}: {profile['total_ms']:.1f} ms при бюджете {args.budget_ms:.0f} ms"
+              f"{' - ПРЕВЫШЕН' if over_budget else ''}")
+        return 1 if over_budget else 0
+
+    if args.command == "run":
+        data = run_suite(args.lengths, args.rounds, args.warmup, args.latency, args.tokens_per_second, args.only)
+        output = args.output
+        if output is None:
+            os.makedirs(RESULTS_DIR, exist_ok=True)
+            output = os.path.join(RESULTS_DIR, f"{data['commit']}.json")
+        save_results(data, output)
+        for result in data["results"]:
+            print(f"{result['name']:<22} {result['length']:>4} {result['median_ms']:>10.3f} ms"
+                  f" {result['prompt_tokens_per_call']:>8} tok")
+        print(f"Результаты сохранены в {output}")
+        return 0
+
+    with open(args.base, encoding="utf-8") as f:
+        base = json.load(f)
+    with open(args.new, encoding="utf-8") as f:
+        new = json.load(f)
+    rows = compare(base, new, args.threshold)
+    for row in rows:
+        mark = "РЕГРЕССИЯ" if row["regression"] else ""
+        print(f"{row['name']:<22} {row['length']:>4} {row['base_ms']:>10.3f} -> {row['new_ms']:>10.3f} ms"
+              f" x{row['ratio']:<6} {mark}")
+    return 1 if any(row["regression"] for row in rows) else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,63 @@
+from typing import Callable, Dict, List
+
+from conversation import ConversationState
+from fake_llm import DEFAULT_REPORT, DEFAULT_SITUATION
+from agents import DialogueAgent, DialogueEndDetector, ReportGenerator, SituationGenerator
+from report_export import build_report_document, render_docx
+
+# Длины диалогов (число сообщений), на которых замеряется каждый этап
+HISTORY_LENGTHS = [4, 8, 16, 50, 100, 200]
+
+def make_history(length: int) -> ConversationState:
+    """Детерминированный диалог заданной длины"""
+    conversation = ConversationState()
+    for i in range(length):
+        if i % 2 == 0:
+            content = f"Сообщение менеджера {i}: наше решение сократит ваши издержки на обработку заявок."
+            conversation.append({'role': 'manager', 'content': content})
+        else:
+            content = f"Ответ клиента {i}: звучит неплохо, но какие гарантии вы даете по срокам внедрения?"
+            conversation.append({'role': 'client', 'content': content})
+    return conversation
+
+def bench_generate_situation(llm, length: int) -> Callable[[], object]:
+    generator = SituationGenerator(llm)
+    return generator.generate_situation
+
+def bench_respond_as_client(llm, length: int) -> Callable[[], object]:
+    agent = DialogueAgent(llm, DEFAULT_SITUATION)
+    history = make_history(length)
+    return lambda: agent.respond_as_client(history)
+
+def bench_end_check_local(llm, length: int) -> Callable[[], object]:
+    detector = DialogueEndDetector(llm, DEFAULT_SITUATION)
+    history = make_history(length)
+    return lambda: detector.should_end_dialogue(history)
+
+def bench_end_check_llm(llm, length: int) -> Callable[[], object]:
+    # Порог выше единицы заставляет детектор каждый раз спрашивать модель
+    detector = DialogueEndDetector(llm, DEFAULT_SITUATION, confidence_threshold=1.1)
+    history = make_history(length)
+    return lambda: detector.should_end_dialogue(history)
+
+def bench_generate_report(llm, length: int) -> Callable[[], object]:
+    generator = ReportGenerator(llm, DEFAULT_SITUATION)
+    history = make_history(length)
+    return lambda: generator.generate_report(history)
+
+def bench_create_docx_report(llm, length: int) -> Callable[[], object]:
+    history = make_history(length)
+    return lambda: render_docx(build_report_document(DEFAULT_REPORT, DEFAULT_SITUATION, history))
+
+# Этапы и признак того, зависит ли этап от длины диалога
+CASES: Dict[str, Dict[str, object]] = {
+    "generate_situation": {"factory": bench_generate_situation, "uses_history": False},
+    "respond_as_client": {"factory": bench_respond_as_client, "uses_history": True},
+    "end_check_local": {"factory": bench_end_check_local, "uses_history": True},
+    "end_check_llm": {"factory": bench_end_check_llm, "uses_history": True},
+    "generate_report": {"factory": bench_generate_report, "uses_history": True},
+    "create_docx_report": {"factory": bench_create_docx_report, "uses_history": True}
+}
+
+def case_lengths(name: str, lengths: List[int]) -> List[int]:
+    return lengths if CASES[name]["uses_history"] else [0]
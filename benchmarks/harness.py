@@ -0,0 +1,88 @@
+import json
+import platform
+import statistics
+import subprocess
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+from batch_eval import percentile
+from fake_llm import FakeChatModel
+from simulator import RecordingLLM, StageStats
+
+from benchmarks.cases import CASES, case_lengths
+
+def measure(fn: Callable[[], object], rounds: int, warmup: int) -> Dict[str, float]:
+    """Замеряет функцию несколько раз и возвращает статистику в миллисекундах"""
+    for _ in range(warmup):
+        fn()
+    timings = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - started) * 1000)
+    return {
+        "rounds": rounds,
+        "min_ms": round(min(timings), 3),
+        "mean_ms": round(statistics.mean(timings), 3),
+        "median_ms": round(statistics.median(timings), 3),
+        "p95_ms": round(percentile(timings, 95), 3),
+        "stddev_ms": round(statistics.stdev(timings), 3) if len(timings) > 1 else 0.0
+    }
+
+def current_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def run_suite(lengths: List[int], rounds: int = 5, warmup: int = 1, latency: float = 0.0,
+              tokens_per_second: float = 0.0, only: Optional[List[str]] = None) -> Dict[str, Any]:
+    """Прогоняет все этапы на всех длинах диалога"""
+    results = []
+    for name in only or list(CASES):
+        for length in case_lengths(name, lengths):
+            stats = StageStats()
+            llm = RecordingLLM(
+                FakeChatModel(latency=latency, tokens_per_second=tokens_per_second), name, stats
+            )
+            result = {"name": name, "length": length}
+            result.update(measure(CASES[name]["factory"](llm, length), rounds, warmup))
+            calls = len(stats.latencies[name])
+            # Средний размер промпта за вызов - показывает рост контекста с длиной диалога
+            result["prompt_tokens_per_call"] = stats.tokens[name]["prompt"] // calls if calls else 0
+            results.append(result)
+    return {
+        "commit": current_commit(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "fake_llm": {"latency": latency, "tokens_per_second": tokens_per_second},
+        "results": results
+    }
+
+def save_results(data: Dict[str, Any], path: str) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+
+def compare(base: Dict[str, Any], new: Dict[str, Any], threshold: float = 0.1) -> List[Dict[str, Any]]:
+    """Сравнивает медианы двух прогонов; regression - замедление больше порога"""
+    base_results = {(r["name"], r["length"]): r for r in base["results"]}
+    rows = []
+    for result in new["results"]:
+        key = (result["name"], result["length"])
+        if key not in base_results:
+            continue
+        before = base_results[key]["median_ms"]
+        after = result["median_ms"]
+        ratio = after / before if before else 1.0
+        rows.append({
+            "name": result["name"],
+            "length": result["length"],
+            "base_ms": before,
+            "new_ms": after,
+            "ratio": round(ratio, 3),
+            "regression": ratio > 1 + threshold
+        })
+    return rows
@@ -0,0 +1,47 @@
+import statistics
+import subprocess
+import sys
+from typing import Any, Dict, List, Tuple
+
+def parse_importtime(output: str) -> List[Tuple[int, int, str]]:
+    """Строки вывода python -X importtime: (глубина вложенности, суммарное время в мкс, модуль)"""
+    rows = []
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        rows.append((depth, int(cumulative), name.strip()))
+    return rows
+
+def import_profile(module: str) -> Dict[str, Any]:
+    """Время импорта модуля в отдельном процессе и его самые тяжелые прямые зависимости"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, check=True
+    )
+    rows = parse_importtime(result.stderr)
+    depth, total, _ = next(row for row in rows if row[2] == module)
+    # Прямые зависимости модуля выводятся перед ним с глубиной на единицу больше
+    index = next(i for i, row in enumerate(rows) if row[2] == module)
+    children = []
+    for child_depth, cumulative, name in reversed(rows[:index]):
+        if child_depth <= depth:
+            break
+        if child_depth == depth + 1:
+            children.append((name, cumulative))
+    return {
+        "module": module,
+        "total_ms": round(total / 1000, 1),
+        "heaviest": [
+            {"module": name, "ms": round(cumulative / 1000, 1)}
+            for name, cumulative in sorted(children, key=lambda item: -item[1])[:10]
+        ]
+    }
+
+def measure_import(module: str, runs: int = 3) -> Dict[str, Any]:
+    """Медиана времени холодного импорта по нескольким запускам"""
+    profiles = [import_profile(module) for _ in range(runs)]
+    median = statistics.median(profile["total_ms"] for profile in profiles)
+    profile = min(profiles, key=lambda item: abs(item["total_ms"] - median))
+    return dict(profile, total_ms=median, runs=runs)
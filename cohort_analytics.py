@@ -0,0 +1,186 @@
+"""Аналитика по отчетам тренировок группы.
+
+Отчеты раскладываются по таблицам SQLite с индексами: одна строка на отчет с оценкой
+и по строке на каждый пункт списков отчета. Агрегаты считаются запросами GROUP BY
+целиком в SQLite и возвращаются как pandas.DataFrame.
+
+Загрузка уже сохраненных тренировок:
+    python cohort_analytics.py sessions.db analytics.db
+"""
+import re
+import sqlite3
+import sys
+import threading
+import time
+from typing import TYPE_CHECKING, Any, Dict, Iterable, List, Optional, Tuple
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+# Списки отчета, пункты которых попадают в аналитику
+ITEM_FIELDS = ("strengths", "weaknesses", "recommendations", "growth_areas",
+               "techniques_used", "missed_opportunities")
+
+UNKNOWN_TRAINEE = "Без имени"
+
+def parse_rating(value: Any) -> Optional[float]:
+    """Оценка из ответа модели: "7", "7/10", "7.5 из 10" -> число от 0 до 10"""
+    match = re.search(r'\d+(?:[.,]\d+)?', str(value))
+    if match is None:
+        return None
+    rating = float(match.group(0).replace(",", "."))
+    return rating if 0 <= rating <= 10 else None
+
+def normalize_item(text: str) -> str:
+    """Ключ пункта отчета для группировки одинаковых формулировок"""
+    return re.sub(r'\s+', ' ', re.sub(r'[^\w\s-]', ' ', str(text).lower())).strip()
+
+class CohortAnalytics:
+    """Хранилище отчетов группы и агрегаты по ним"""
+
+    def __init__(self, path: str = "analytics.db"):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS reports ("
+                "session_id TEXT PRIMARY KEY, trainee TEXT, rating REAL, created REAL, day TEXT)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS report_items ("
+                "session_id TEXT, kind TEXT, item TEXT, text TEXT)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS reports_trainee ON reports (trainee, created)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS reports_day ON reports (day)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS items_kind ON report_items (kind, item)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS items_session_item ON report_items (session_id, kind, item)")
+
+    def ingest(self, session_id: str, report: Dict[str, Any], trainee: Optional[str] = None,
+               created: Optional[float] = None) -> None:
+        """Добавляет или заменяет отчет тренировки.
+
+        Без created при замене сохраняется время уже загруженного отчета, поэтому
+        повторная загрузка (например, после смены имени участника) не переносит его на сегодня.
+        """
+        self.ingest_many([(session_id, report, trainee, created)])
+
+    def ingest_many(self, reports: Iterable[Tuple[str, Dict[str, Any], Optional[str], Optional[float]]]) -> int:
+        """Добавляет отчеты одной транзакцией: (session_id, отчет, участник, время)"""
+        rows, items = [], []
+        for session_id, report, trainee, created in reports:
+            rows.append([session_id, trainee or UNKNOWN_TRAINEE, parse_rating(report.get("overall_rating")),
+                         created, created])
+            unique = {
+                (kind, normalize_item(text)): str(text).strip()
+                for kind in ITEM_FIELDS
+                for text in report.get(kind) or []
+                if normalize_item(text)
+            }
+            items.extend((session_id, kind, item, text) for (kind, item), text in unique.items())
+        with self._lock, self._conn:
+            for row in rows:
+                if row[3] is None:
+                    existing = self._conn.execute(
+                        "SELECT created FROM reports WHERE session_id = ?", (row[0],)
+                    ).fetchone()
+                    row[3] = row[4] = existing[0] if existing else time.time()
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO reports (session_id, trainee, rating, created, day) "
+                "VALUES (?, ?, ?, ?, date(?, 'unixepoch', 'localtime'))", rows
+            )
+            self._conn.executemany(
+                "DELETE FROM report_items WHERE session_id = ?", [(row[0],) for row in rows]
+            )
+            self._conn.executemany(
+                "INSERT INTO report_items (session_id, kind, item, text) VALUES (?, ?, ?, ?)", items
+            )
+        return len(rows)
+
+    def ingest_sessions(self, sessions: Iterable[Dict[str, Any]], batch_size: int = 1000) -> int:
+        """Загружает отчеты сессий из SessionStore.sessions() пачками"""
+        count, batch = 0, []
+        for session in sessions:
+            if session.get("report"):
+                batch.append((session["id"], session["report"], session.get("trainee"), session.get("updated")))
+            if len(batch) >= batch_size:
+                count += self.ingest_many(batch)
+                batch = []
+        return count + self.ingest_many(batch)
+
+    def _query(self, sql: str, params: tuple = ()) -> "pd.DataFrame":
+        # pandas нужен только странице аналитики, поэтому не грузим его при старте тренажера
+        import pandas as pd
+
+        with self._lock:
+            return pd.read_sql_query(sql, self._conn, params=params)
+
+    def trainees(self) -> List[str]:
+        return self._query("SELECT DISTINCT trainee FROM reports ORDER BY trainee")["trainee"].tolist()
+
+    def summary(self, trainee: Optional[str] = None, since: Optional[float] = None) -> Dict[str, Any]:
+        """Число тренировок, участников и средняя оценка"""
+        row = self._query(
+            "SELECT COUNT(*) AS sessions, COUNT(DISTINCT trainee) AS trainees, AVG(rating) AS avg_rating "
+            "FROM reports WHERE created >= ? AND (? IS NULL OR trainee = ?)", (since or 0, trainee, trainee)
+        ).iloc[0]
+        return {"sessions": int(row["sessions"]), "trainees": int(row["trainees"]), "avg_rating": row["avg_rating"]}
+
+    def rating_distribution(self, trainee: Optional[str] = None, since: Optional[float] = None) -> "pd.DataFrame":
+        """Распределение оценок по участникам: участник x целая оценка -> число тренировок"""
+        return self._query(
+            "SELECT trainee, CAST(rating AS INTEGER) AS rating, COUNT(*) AS sessions FROM reports "
+            "WHERE rating IS NOT NULL AND created >= ? AND (? IS NULL OR trainee = ?) "
+            "GROUP BY trainee, CAST(rating AS INTEGER) ORDER BY trainee, rating",
+            (since or 0, trainee, trainee)
+        )
+
+    def trainee_ratings(self, since: Optional[float] = None) -> "pd.DataFrame":
+        """Сводка оценок по участникам"""
+        return self._query(
+            "SELECT trainee, COUNT(*) AS sessions, AVG(rating) AS avg_rating, MIN(rating) AS min_rating, "
+            "MAX(rating) AS max_rating FROM reports WHERE created >= ? "
+            "GROUP BY trainee ORDER BY avg_rating DESC",
+            (since or 0,)
+        )
+
+    def ratings_over_time(self, trainee: Optional[str] = None, since: Optional[float] = None) -> "pd.DataFrame":
+        """Средняя оценка и число тренировок по дням"""
+        return self._query(
+            "SELECT day, AVG(rating) AS avg_rating, COUNT(*) AS sessions FROM reports "
+            "WHERE created >= ? AND (? IS NULL OR trainee = ?) GROUP BY day ORDER BY day",
+            (since or 0, trainee, trainee)
+        )
+
+    def top_items(self, kind: str = "weaknesses", limit: int = 10, trainee: Optional[str] = None,
+                  since: Optional[float] = None) -> "pd.DataFrame":
+        """Самые частые пункты отчетов заданного вида"""
+        return self._query(
+            "SELECT MIN(i.text) AS item, COUNT(*) AS sessions FROM report_items i "
+            "JOIN reports r ON r.session_id = i.session_id "
+            "WHERE i.kind = ? AND r.created >= ? AND (? IS NULL OR r.trainee = ?) "
+            "GROUP BY i.item ORDER BY sessions DESC LIMIT ?",
+            (kind, since or 0, trainee, trainee, limit)
+        )
+
+    def technique_cooccurrence(self, limit: int = 20, trainee: Optional[str] = None,
+                               since: Optional[float] = None) -> "pd.DataFrame":
+        """Пары техник, которые чаще всего применяются в одной тренировке"""
+        # Пары ищутся внутри сессии; без подсказки SQLite выбирает индекс по виду
+        # пункта и сравнивает каждую технику со всеми техниками всех сессий
+        return self._query(
+            "SELECT MIN(a.text) AS technique_a, MIN(b.text) AS technique_b, COUNT(*) AS sessions "
+            "FROM report_items a JOIN report_items b INDEXED BY items_session_item "
+            "ON a.session_id = b.session_id AND b.kind = a.kind AND a.item < b.item "
+            "JOIN reports r ON r.session_id = a.session_id "
+            "WHERE a.kind = 'techniques_used' AND r.created >= ? AND (? IS NULL OR r.trainee = ?) "
+            "GROUP BY a.item, b.item ORDER BY sessions DESC LIMIT ?",
+            (since or 0, trainee, trainee, limit)
+        )
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        sys.exit("Использование: python cohort_analytics.py <sessions.db> <analytics.db>")
+    from session_store import SQLiteSessionStore
+    loaded = CohortAnalytics(sys.argv[2]).ingest_sessions(SQLiteSessionStore(sys.argv[1]).sessions())
+    print(f"Загружено отчетов: {loaded}")
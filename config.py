@@ -1,11 +1,38 @@
 import os
-import yaml
+import threading
+from collections.abc import Mapping
 
 def get_config():
+    import yaml
+
     path_to_config = "config.yaml"
     yaml_config_path = os.getenv("APP_CONFIG_FILE_PATH", path_to_config)
     with open(yaml_config_path, encoding="utf-8") as f:
         config = yaml.safe_load(f)
     return config
 
-CONFIG = get_config()
+class LazyConfig(Mapping):
+    """Конфигурация, которая читается из YAML при первом обращении, а не при импорте"""
+
+    def __init__(self, loader):
+        self._loader = loader
+        self._config = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if self._config is None:
+            with self._lock:
+                if self._config is None:
+                    self._config = self._loader() or {}
+        return self._config
+
+    def __getitem__(self, key):
+        return self._load()[key]
+
+    def __iter__(self):
+        return iter(self._load())
+
+    def __len__(self):
+        return len(self._load())
+
+CONFIG = LazyConfig(get_config)
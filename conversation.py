@@ -0,0 +1,169 @@
+import threading
+from concurrent.futures import Executor
+from typing import Callable, List, Dict, Optional, Iterable, Iterator
+
+from instrumentation import METRICS
+
+ROLE_LABELS = {
+    'manager': 'Менеджер',
+    'client': 'Клиент'
+}
+
+def message_label(msg: Dict[str, str]) -> Optional[str]:
+    """Подпись автора сообщения: в групповых переговорах реплики клиента подписаны участником"""
+    label = ROLE_LABELS.get(msg['role'])
+    if label is not None and msg.get('speaker'):
+        return msg['speaker']
+    return label
+
+def format_message(msg: Dict[str, str]) -> str:
+    """Форматирует сообщение в строку стенограммы"""
+    label = message_label(msg)
+    if label is None:
+        return ""
+    return f"{label}: {msg['content']}\n"
+
+class ConversationState:
+    """Состояние диалога с инкрементально собираемой стенограммой.
+
+    Каждое сообщение форматируется один раз при добавлении, готовая стенограмма кэшируется.
+    В ограниченном режиме (context_messages > 0) модели передаются только последние
+    сообщения дословно, а более ранние сворачиваются в скользящее резюме. Резюме
+    готовится вне блокировки, поэтому пока модель отвечает, диалог можно читать и дополнять;
+    с executor резюме готовится в фоне и не задерживает ход. Если резюмирование не удалось,
+    сообщения остаются в окне дословно и сворачиваются при следующем добавлении.
+    on_append вызывается после добавления каждого сообщения, например для записи в хранилище.
+    """
+
+    def __init__(self, messages: Optional[Iterable[Dict[str, str]]] = None,
+                 context_messages: int = 0, summarizer=None,
+                 on_append: Optional[Callable[["ConversationState", Dict[str, str]], None]] = None,
+                 executor: Optional[Executor] = None):
+        self.messages: List[Dict[str, str]] = []
+        self.context_messages = context_messages
+        self.summarizer = summarizer
+        self.executor = executor
+        self.on_append = None
+        self.summary = ""
+        self._lines: List[str] = []
+        self._summarized = 0  # Сколько строк уже свернуто в резюме
+        self._compacting = False  # Резюме сейчас готовится в другом потоке
+        self._transcript: Optional[str] = None
+        self._context: Optional[str] = None
+        self._lock = threading.RLock()
+        for msg in messages or []:
+            self.append(msg)
+        self.on_append = on_append
+
+    @classmethod
+    def restore(cls, messages: Iterable[Dict[str, str]], summary: str = "", summarized: int = 0,
+                context_messages: int = 0, summarizer=None,
+                on_append: Optional[Callable[["ConversationState", Dict[str, str]], None]] = None
+                ) -> "ConversationState":
+        """Восстанавливает сохраненный диалог вместе с резюме, не вызывая модель заново"""
+        state = cls(context_messages=context_messages, summarizer=summarizer, on_append=on_append)
+        state.messages = list(messages)
+        state._lines = [format_message(msg) for msg in state.messages]
+        state.summary = summary
+        state._summarized = min(summarized, len(state._lines)) if summary else 0
+        return state
+
+    @property
+    def summarized(self) -> int:
+        """Сколько первых сообщений свернуто в резюме"""
+        return self._summarized
+
+    def _add(self, msg: Dict[str, str]) -> None:
+        self.messages.append(msg)
+        self._lines.append(format_message(msg))
+        self._transcript = None
+        self._context = None
+        if self.on_append is not None:
+            self.on_append(self, msg)
+
+    def append(self, msg: Dict[str, str]) -> None:
+        """Добавляет сообщение и форматирует его для стенограммы"""
+        with self._lock:
+            self._add(msg)
+        self._compact()
+
+    def extend(self, messages: Iterable[Dict[str, str]]) -> None:
+        """Добавляет несколько сообщений, сворачивая устаревшие в резюме один раз в конце"""
+        with self._lock:
+            for msg in messages:
+                self._add(msg)
+        self._compact()
+
+    def transcript(self) -> str:
+        """Полная стенограмма диалога"""
+        with self._lock:
+            if self._transcript is None:
+                self._transcript = "".join(self._lines)
+            return self._transcript
+
+    def context(self) -> str:
+        """Текст истории для промпта с учетом ограничения контекста"""
+        with self._lock:
+            if not self.summary:
+                return self.transcript()
+            if self._context is None:
+                recent = "".join(self._lines[self._summarized:])
+                self._context = (
+                    f"Краткое содержание предыдущей части диалога:\n{self.summary}\n\n"
+                    f"Последние реплики:\n{recent}"
+                )
+            return self._context
+
+    def _compact(self) -> None:
+        """Сворачивает устаревшие сообщения в резюме пачками по половине окна.
+
+        Под блокировкой берется снимок строк и прежнего резюме, модель вызывается
+        без блокировки, а готовое резюме подставляется целиком. Одновременно идет
+        не больше одного сворачивания: сообщения, добавленные за это время,
+        свернутся при следующем.
+        """
+        if not self.context_messages or self.summarizer is None:
+            return
+        with self._lock:
+            overflow = len(self._lines) - self._summarized - self.context_messages
+            batch = max(1, self.context_messages // 2)
+            if self._compacting or overflow < batch:
+                return
+            self._compacting = True
+            start = self._summarized
+            previous_summary = self.summary
+            lines = self._lines[start:start + overflow]
+        if self.executor is not None:
+            self.executor.submit(self._summarize, start, previous_summary, lines)
+        else:
+            self._summarize(start, previous_summary, lines)
+
+    def _summarize(self, start: int, previous_summary: str, lines: List[str]) -> None:
+        try:
+            summary = self.summarizer.summarize(previous_summary, "".join(lines))
+        except Exception:
+            # Сбой модели не прерывает ход: окно остается несвернутым до следующей попытки
+            METRICS.record_fallback("summarizer")
+            with self._lock:
+                self._compacting = False
+            return
+        with self._lock:
+            self.summary = summary
+            self._summarized = start + len(lines)
+            self._context = None
+            self._compacting = False
+
+    def __iter__(self) -> Iterator[Dict[str, str]]:
+        return iter(list(self.messages))
+
+    def __len__(self) -> int:
+        return len(self.messages)
+
+    def __getitem__(self, index):
+        return self.messages[index]
+
+def as_conversation_state(conversation_history) -> ConversationState:
+    """Приводит список сообщений к ConversationState"""
+    if isinstance(conversation_history, ConversationState):
+        return conversation_history
+    return ConversationState(conversation_history)
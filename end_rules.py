@@ -0,0 +1,177 @@
+import json
+import pickle
+import re
+import sys
+from typing import Dict, List, Optional, Tuple
+
+# Фразы клиента, означающие согласие на предложение. Текст сравнивается после
+# замены ё на е, поэтому варианты с ё в шаблонах не нужны. Фраза не считается,
+# если раньше в том же предложении есть отрицание: «не могу сказать, что согласен»
+AGREEMENT_PATTERNS = [
+    r'\bдоговорились\b',
+    r'\bсоглас(ен|на|ны)\b',
+    r'\bпо рукам\b',
+    r'\bподписываем\b',
+    r'\bоформляйте\b',
+    r'\bприсылайте (договор|счет|коммерческое)',
+    r'\bвысылайте (договор|счет)',
+    r'\bберем\b',
+    r'\bдавайте (начнем (работать|сотрудничать)|оформлять|оформим|подписывать|подпишем|запускать|запустим)\b',
+    r'\bготовы (подписать|начать|купить|оплатить)',
+    r'\bвы меня убедили\b',
+]
+
+# Фразы клиента, означающие окончательный отказ; отрицание перед фразой так же снимает ее
+REFUSAL_PATTERNS = [
+    r'\bне интересно\b',
+    r'\bнам это не нужно\b',
+    r'\bмы отказываемся\b|\bвынуждены отказаться\b',
+    r'\bразговор окончен\b',
+    r'\bне звоните\b|\bне пишите\b',
+    r'\bвсего доброго\b|\bвсего хорошего\b|\bдо свидания\b',
+    r'\bнет,? спасибо\b',
+    r'\bмы выбрали (другого|другую|конкурент)',
+]
+
+# Оговорки, при которых согласие еще не окончательное
+HEDGE_PATTERNS = [
+    r'\bно\b', r'\bоднако\b', r'\bесли\b', r'\bпри условии\b', r'\bподумаю\b', r'\bподумаем\b',
+    r'\bпосоветуюсь\b', r'\bобсудим\b',
+    # Частичное несогласие: «не совсем согласен», «не до конца договорились»
+    r'\bне (совсем|вполне|очень|полностью|до конца|во всем|со всем)\b',
+    # Согласие с утверждением, а не с предложением: «согласен, что дорого»
+    r'\bсоглас(ен|на|ны),? (что|с тем)\b',
+    # Условия и ограничения: «не интересно без скидки», «согласен только частично»
+    r'\bбез\b', r'\bтолько\b', r'\bчастично\b', r'\bпока\b',
+    # Клиент просит еще информации: «не интересны обещания. Покажите кейсы»
+    r'\b(покажите|расскажите|объясните|докажите|уточните)\b',
+]
+
+# Отрицание в предложении перед фразой согласия или отказа
+NEGATION_PATTERN = r'\b(не|ни)\b'
+SENTENCE_END_PATTERN = r'[.!?;…]'
+
+def _compile(patterns: List[str]) -> "re.Pattern":
+    return re.compile("|".join(f"(?:{p})" for p in patterns), re.IGNORECASE)
+
+_AGREEMENT = _compile(AGREEMENT_PATTERNS)
+_REFUSAL = _compile(REFUSAL_PATTERNS)
+_HEDGE = _compile(HEDGE_PATTERNS)
+_NEGATION = re.compile(NEGATION_PATTERN, re.IGNORECASE)
+_SENTENCE_END = re.compile(SENTENCE_END_PATTERN)
+
+def _affirmed(pattern: "re.Pattern", text: str) -> bool:
+    """Есть ли фраза, перед которой в том же предложении нет отрицания"""
+    for match in pattern.finditer(text):
+        sentence_start = max((end.end() for end in _SENTENCE_END.finditer(text, 0, match.start())), default=0)
+        if not _NEGATION.search(text, sentence_start, match.start()):
+            return True
+    return False
+
+def last_round(conversation_history) -> List[Dict[str, str]]:
+    """Последний ход: последняя реплика менеджера и все ответы на нее.
+
+    В групповых переговорах на реплику менеджера отвечают несколько участников.
+    """
+    messages = list(conversation_history)
+    manager_indexes = [i for i, msg in enumerate(messages) if msg['role'] == 'manager']
+    return messages[manager_indexes[-1]:] if manager_indexes else messages[-1:]
+
+def last_exchange(conversation_history) -> str:
+    """Последняя реплика менеджера и ответы клиента на нее - признаки для классификаторов"""
+    lines = []
+    for msg in last_round(conversation_history):
+        role = "Менеджер" if msg['role'] == 'manager' else "Клиент"
+        lines.append(f"{role}: {msg['content']}")
+    return "\n".join(lines)
+
+class RuleClassifier:
+    """Быстрый классификатор завершения диалога по ключевым фразам клиента.
+
+    В групповых переговорах проверяется каждый ответ последнего хода: диалог
+    завершается, только если к этому ведут ответы всех участников.
+    """
+
+    def classify(self, conversation_history) -> Tuple[bool, float]:
+        """Возвращает решение и уверенность в нем от 0 до 1"""
+        replies = [msg['content'] for msg in last_round(conversation_history) if msg['role'] == 'client']
+        if not replies:
+            # Менеджер еще не получил ответа - смотрим на последнюю реплику клиента
+            replies = [msg['content'] for msg in conversation_history if msg['role'] == 'client'][-1:]
+        if not replies:
+            return False, 1.0
+        decisions = [self._classify_reply(text) for text in replies]
+        if all(decision for decision, _ in decisions):
+            return True, min(confidence for _, confidence in decisions)
+        # Кто-то из участников продолжает разговор: уверенность задает самый уверенный из них
+        return False, max(confidence for decision, confidence in decisions if not decision)
+
+    def _classify_reply(self, text: str) -> Tuple[bool, float]:
+        text = text.replace('ё', 'е').replace('Ё', 'Е')
+        hedged = bool(_HEDGE.search(text)) or '?' in text
+        if _affirmed(_REFUSAL, text):
+            return True, 0.7 if hedged else 0.9
+        if _affirmed(_AGREEMENT, text):
+            return True, 0.6 if hedged else 0.9
+        if '?' in text:
+            # Клиент задает вопросы - разговор продолжается
+            return False, 0.85
+        return False, 0.5
+
+class ModelClassifier:
+    """Обученная модель (scikit-learn pipeline с predict_proba) поверх текста последних реплик"""
+
+    def __init__(self, model_path: str):
+        with open(model_path, 'rb') as f:
+            self.model = pickle.load(f)
+
+    def classify(self, conversation_history) -> Tuple[bool, float]:
+        proba = self.model.predict_proba([last_exchange(conversation_history)])[0]
+        end_probability = float(proba[list(self.model.classes_).index(1)])
+        return end_probability >= 0.5, max(end_probability, 1 - end_probability)
+
+class LocalEndClassifier:
+    """Локальная стадия детектора: правила, уточняемые моделью, если она обучена"""
+
+    def __init__(self, model_path: Optional[str] = None):
+        self.rules = RuleClassifier()
+        self.model = ModelClassifier(model_path) if model_path else None
+
+    def classify(self, conversation_history) -> Tuple[bool, float]:
+        decision, confidence = self.rules.classify(conversation_history)
+        if self.model is not None:
+            model_decision, model_confidence = self.model.classify(conversation_history)
+            if model_confidence > confidence:
+                return model_decision, model_confidence
+        return decision, confidence
+
+def log_decision(path: str, conversation_history, decision: bool) -> None:
+    """Записывает решение LLM как размеченный пример для обучения модели"""
+    record = {"text": last_exchange(conversation_history), "label": int(decision)}
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+def train_model(log_path: str, model_path: str) -> None:
+    """Обучает модель завершения диалога на журнале решений LLM"""
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.pipeline import make_pipeline
+
+    texts, labels = [], []
+    with open(log_path, encoding='utf-8') as f:
+        for line in f:
+            record = json.loads(line)
+            texts.append(record["text"])
+            labels.append(record["label"])
+
+    model = make_pipeline(
+        TfidfVectorizer(analyzer='char_wb', ngram_range=(2, 4), min_df=2),
+        LogisticRegression(max_iter=1000, class_weight='balanced')
+    )
+    model.fit(texts, labels)
+    with open(model_path, 'wb') as f:
+        pickle.dump(model, f)
+
+if __name__ == "__main__":
+    # python end_rules.py end_decisions.jsonl end_model.pkl
+    train_model(sys.argv[1], sys.argv[2])
@@ -0,0 +1,105 @@
+import json
+import time
+from typing import Any, Dict, Iterator, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+DEFAULT_SITUATION = {
+    "situation": "Переговоры о продлении годового контракта на облачное хранилище",
+    "manager_role": "Менеджер по работе с ключевыми клиентами",
+    "client_role": "Финансовый директор",
+    "manager_goal": "Продлить контракт без скидки",
+    "client_concerns": "Рост цены, конкурентные предложения",
+    "product": "Облачное хранилище",
+    "context": "Клиент работает с компанией третий год"
+}
+
+DEFAULT_STAKEHOLDERS = [
+    {"role": "Финансовый директор", "concerns": "Рост цены"},
+    {"role": "Технический директор", "concerns": "Перенос данных к конкуренту"},
+    {"role": "Руководитель закупок", "concerns": "Условия оплаты"}
+]
+
+DEFAULT_REPORT = {
+    "summary": "Менеджер аргументировал ценность продукта",
+    "strengths": ["Уверенная презентация"],
+    "weaknesses": ["Мало уточняющих вопросов"],
+    "recommendations": ["Выяснять критерии выбора клиента"],
+    "growth_areas": ["Работа с возражениями"],
+    "techniques_used": ["Презентация выгод"],
+    "missed_opportunities": ["Не предложил пилотный проект"],
+    "overall_rating": "7"
+}
+
+def estimate_tokens(text: str) -> int:
+    """Грубая оценка числа токенов для русского текста"""
+    return max(1, len(text) // 4)
+
+class FakeChatModel(BaseChatModel):
+    """Детерминированная локальная замена GigaChat для офлайн-прогонов.
+
+    Ответ выбирается по содержимому промпта: JSON ситуации, JSON отчета, "ДА"/"НЕТ"
+    для детектора завершения или реплика клиента. latency задает задержку до первого
+    токена, tokens_per_second - скорость генерации (0 - мгновенно).
+    """
+
+    model: str = "fake-gigachat"
+    latency: float = 0.0
+    tokens_per_second: float = 0.0
+    client_reply: str = "Это слишком дорого. Какие у вас есть гарантии?"
+    end_answer: str = "НЕТ"
+    summary_reply: str = "Клиент сомневается в цене, менеджер приводит аргументы."
+    situation: Dict[str, str] = DEFAULT_SITUATION
+    report: Dict[str, Any] = DEFAULT_REPORT
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-gigachat"
+
+    def _respond(self, messages: List[BaseMessage]) -> str:
+        prompt = "\n".join(str(message.content) for message in messages)
+        if '"ДА"' in prompt and '"НЕТ"' in prompt:
+            return self.end_answer
+        if '"manager_goal"' in prompt:
+            if '"stakeholders"' in prompt:
+                return json.dumps(dict(self.situation, stakeholders=DEFAULT_STAKEHOLDERS), ensure_ascii=False)
+            return json.dumps(self.situation, ensure_ascii=False)
+        if '"overall_rating"' in prompt or '"recommendations"' in prompt:
+            return json.dumps(self.report, ensure_ascii=False)
+        if "резюме" in prompt.lower() and "Новые реплики" in prompt:
+            return self.summary_reply
+        return self.client_reply
+
+    def _message(self, messages: List[BaseMessage], text: str) -> AIMessage:
+        prompt_tokens = sum(estimate_tokens(str(message.content)) for message in messages)
+        completion_tokens = estimate_tokens(text)
+        return AIMessage(content=text, usage_metadata={
+            "input_tokens": prompt_tokens,
+            "output_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens
+        })
+
+    def _generation_time(self, text: str) -> float:
+        if not self.tokens_per_second:
+            return 0.0
+        return estimate_tokens(text) / self.tokens_per_second
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager=None, **kwargs: Any) -> ChatResult:
+        text = self._respond(messages)
+        time.sleep(self.latency + self._generation_time(text))
+        return ChatResult(generations=[ChatGeneration(message=self._message(messages, text))])
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                run_manager=None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        text = self._respond(messages)
+        time.sleep(self.latency)
+        for i, word in enumerate(text.split(" ")):
+            chunk = word if i == 0 else " " + word
+            time.sleep(self._generation_time(chunk))
+            yield ChatGenerationChunk(message=AIMessageChunk(content=chunk))
+        # Расход токенов приходит последним пустым фрагментом, как у потокового API GigaChat
+        usage = self._message(messages, text).usage_metadata
+        yield ChatGenerationChunk(message=AIMessageChunk(content="", usage_metadata=usage))
@@ -0,0 +1,311 @@
+import json
+import logging
+import threading
+import time
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from logging.handlers import RotatingFileHandler
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple
+
+# Границы корзин гистограммы задержек, секунды
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+call_logger = logging.getLogger("llm_calls")
+
+def token_usage(message) -> Dict[str, int]:
+    """Достает расход токенов из ответа модели"""
+    usage = getattr(message, "usage_metadata", None)
+    if usage:
+        return {"prompt": usage.get("input_tokens", 0), "completion": usage.get("output_tokens", 0)}
+    token_usage_data = (getattr(message, "response_metadata", None) or {}).get("token_usage") or {}
+    if not isinstance(token_usage_data, dict):
+        token_usage_data = vars(token_usage_data)
+    return {
+        "prompt": token_usage_data.get("prompt_tokens", 0),
+        "completion": token_usage_data.get("completion_tokens", 0)
+    }
+
+def model_name(llm) -> str:
+    """Имя модели, спрятанной за цепочкой оберток"""
+    while llm is not None:
+        for attr in ("model", "model_name"):
+            name = getattr(llm, attr, None)
+            if isinstance(name, str) and name:
+                return name
+        llm = getattr(llm, "llm", None)
+    return "unknown"
+
+# Ключ response_metadata, которым RoutedLLM помечает ответы запасной модели
+ANSWERED_BY = "answered_by"
+
+def answered_by(message, default: str) -> str:
+    """Модель, которая на самом деле дала ответ: запасная, если ответ помечен ею"""
+    metadata = getattr(message, "response_metadata", None) or {}
+    return metadata.get(ANSWERED_BY) or default
+
+class CallStats:
+    """Накопленная статистика вызовов одного агента к одной модели"""
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.latency_sum = 0.0
+        self.latency_buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+
+    def observe(self, latency: float, usage: Dict[str, int], error: bool) -> None:
+        self.calls += 1
+        self.errors += int(error)
+        self.latency_sum += latency
+        index = next((i for i, bound in enumerate(LATENCY_BUCKETS) if latency <= bound), len(LATENCY_BUCKETS))
+        self.latency_buckets[index] += 1
+        self.prompt_tokens += usage.get("prompt", 0)
+        self.completion_tokens += usage.get("completion", 0)
+
+    def latency_quantile(self, q: float) -> float:
+        """Оценка квантиля задержки по гистограмме (верхняя граница корзины)"""
+        if not self.calls:
+            return 0.0
+        rank = q * self.calls
+        seen = 0
+        for bound, count in zip(LATENCY_BUCKETS + (float("inf"),), self.latency_buckets):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+class LLMMetrics:
+    """Потокобезопасный реестр метрик вызовов LLM для всего процесса"""
+
+    def __init__(self):
+        self.calls: Dict[Tuple[str, str], CallStats] = defaultdict(CallStats)
+        self.retries: Dict[str, int] = defaultdict(int)
+        self.fallbacks: Dict[str, int] = defaultdict(int)
+        self.parse_failures: Dict[str, int] = defaultdict(int)
+        self.cache_hits: Dict[str, int] = defaultdict(int)
+        self.cache_misses: Dict[str, int] = defaultdict(int)
+        self.model_fallbacks: Dict[Tuple[str, str], int] = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def record_call(self, agent: str, model: str, latency: float, usage: Dict[str, int],
+                    error: Optional[BaseException] = None, streamed: bool = False) -> None:
+        with self._lock:
+            self.calls[(agent, model)].observe(latency, usage, error is not None)
+        if call_logger.handlers:
+            call_logger.info(json.dumps({
+                "ts": round(time.time(), 3),
+                "agent": agent,
+                "model": model,
+                "latency": round(latency, 4),
+                "prompt_tokens": usage.get("prompt", 0),
+                "completion_tokens": usage.get("completion", 0),
+                "streamed": streamed,
+                "error": repr(error) if error is not None else None
+            }, ensure_ascii=False))
+
+    def record_retry(self, model: str) -> None:
+        with self._lock:
+            self.retries[model] += 1
+
+    def record_fallback(self, agent: str) -> None:
+        """Агент вернул результат по умолчанию вместо ответа модели"""
+        with self._lock:
+            self.fallbacks[agent] += 1
+
+    def record_parse_failure(self, agent: str) -> None:
+        """Ответ модели не удалось разобрать"""
+        with self._lock:
+            self.parse_failures[agent] += 1
+
+    def record_model_fallback(self, agent: str, reason: str) -> None:
+        """Запрос агента ушел на запасную модель (error, timeout или slo)"""
+        with self._lock:
+            self.model_fallbacks[(agent, reason)] += 1
+
+    def record_cache(self, agent: str, hit: bool) -> None:
+        """Обращение агента к кэшу ответов"""
+        with self._lock:
+            if hit:
+                self.cache_hits[agent] += 1
+            else:
+                self.cache_misses[agent] += 1
+
+    def cache_hit_rate(self, agent: str) -> Optional[float]:
+        lookups = self.cache_hits.get(agent, 0) + self.cache_misses.get(agent, 0)
+        return self.cache_hits.get(agent, 0) / lookups if lookups else None
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        """Сводка по агентам и моделям для панели администратора"""
+        with self._lock:
+            return [
+                {
+                    "agent": agent,
+                    "model": model,
+                    "calls": stats.calls,
+                    "errors": stats.errors,
+                    "avg_latency": round(stats.latency_sum / stats.calls, 3) if stats.calls else 0.0,
+                    "p95_latency": stats.latency_quantile(0.95),
+                    "prompt_tokens": stats.prompt_tokens,
+                    "completion_tokens": stats.completion_tokens,
+                    "fallbacks": self.fallbacks.get(agent, 0),
+                    "parse_failures": self.parse_failures.get(agent, 0),
+                    "cache_hit_rate": self.cache_hit_rate(agent),
+                    "model_fallbacks": sum(
+                        count for (fallback_agent, _), count in self.model_fallbacks.items() if fallback_agent == agent
+                    )
+                }
+                for (agent, model), stats in sorted(self.calls.items())
+            ]
+
+    def render_prometheus(self) -> str:
+        """Метрики в текстовом формате Prometheus"""
+        families: Dict[str, List[str]] = {
+            "llm_calls_total counter": [],
+            "llm_errors_total counter": [],
+            "llm_tokens_total counter": [],
+            "llm_latency_seconds histogram": [],
+            "llm_retries_total counter": [],
+            "llm_fallbacks_total counter": [],
+            "llm_parse_failures_total counter": [],
+            "llm_cache_lookups_total counter": [],
+            "llm_model_fallbacks_total counter": []
+        }
+        with self._lock:
+            for (agent, model), stats in sorted(self.calls.items()):
+                labels = f'agent="{agent}",model="{model}"'
+                families["llm_calls_total counter"].append(f"llm_calls_total{{{labels}}} {stats.calls}")
+                families["llm_errors_total counter"].append(f"llm_errors_total{{{labels}}} {stats.errors}")
+                families["llm_tokens_total counter"].extend([
+                    f'llm_tokens_total{{{labels},kind="prompt"}} {stats.prompt_tokens}',
+                    f'llm_tokens_total{{{labels},kind="completion"}} {stats.completion_tokens}'
+                ])
+                latency = families["llm_latency_seconds histogram"]
+                cumulative = 0
+                for bound, count in zip(LATENCY_BUCKETS + (float("inf"),), stats.latency_buckets):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else bound
+                    latency.append(f'llm_latency_seconds_bucket{{{labels},le="{le}"}} {cumulative}')
+                latency.append(f"llm_latency_seconds_sum{{{labels}}} {stats.latency_sum:.6f}")
+                latency.append(f"llm_latency_seconds_count{{{labels}}} {stats.calls}")
+            for model, count in sorted(self.retries.items()):
+                families["llm_retries_total counter"].append(f'llm_retries_total{{model="{model}"}} {count}')
+            for agent, count in sorted(self.fallbacks.items()):
+                families["llm_fallbacks_total counter"].append(f'llm_fallbacks_total{{agent="{agent}"}} {count}')
+            for agent, count in sorted(self.parse_failures.items()):
+                families["llm_parse_failures_total counter"].append(
+                    f'llm_parse_failures_total{{agent="{agent}"}} {count}'
+                )
+            for agent in sorted(set(self.cache_hits) | set(self.cache_misses)):
+                families["llm_cache_lookups_total counter"].extend([
+                    f'llm_cache_lookups_total{{agent="{agent}",result="hit"}} {self.cache_hits.get(agent, 0)}',
+                    f'llm_cache_lookups_total{{agent="{agent}",result="miss"}} {self.cache_misses.get(agent, 0)}'
+                ])
+            for (agent, reason), count in sorted(self.model_fallbacks.items()):
+                families["llm_model_fallbacks_total counter"].append(
+                    f'llm_model_fallbacks_total{{agent="{agent}",reason="{reason}"}} {count}'
+                )
+        lines = []
+        for family, samples in families.items():
+            lines.append(f"# TYPE {family}")
+            lines.extend(samples)
+        return "\n".join(lines) + "\n"
+
+# Общий реестр метрик процесса
+METRICS = LLMMetrics()
+
+class InstrumentedLLM:
+    """Обертка над моделью, записывающая задержку, токены и ошибки каждого вызова агента.
+
+    Вызов учитывается за той моделью, которая ответила: при переключении маршрута
+    это запасная модель, а не основная.
+    """
+
+    def __init__(self, llm, agent: str, metrics: LLMMetrics = METRICS):
+        self.llm = llm
+        self.agent = agent
+        self.metrics = metrics
+        self.model = model_name(llm)
+
+    def invoke(self, messages, **kwargs: Any):
+        started = time.perf_counter()
+        try:
+            response = self.llm.invoke(messages, **kwargs)
+        except Exception as exc:
+            self.metrics.record_call(self.agent, self.model, time.perf_counter() - started, {}, exc)
+            raise
+        self.metrics.record_call(
+            self.agent, answered_by(response, self.model), time.perf_counter() - started, token_usage(response)
+        )
+        return response
+
+    async def ainvoke(self, messages, **kwargs: Any):
+        started = time.perf_counter()
+        try:
+            response = await self.llm.ainvoke(messages, **kwargs)
+        except Exception as exc:
+            self.metrics.record_call(self.agent, self.model, time.perf_counter() - started, {}, exc)
+            raise
+        self.metrics.record_call(
+            self.agent, answered_by(response, self.model), time.perf_counter() - started, token_usage(response)
+        )
+        return response
+
+    def stream(self, messages, **kwargs: Any) -> Iterator[Any]:
+        started = time.perf_counter()
+        usage = {"prompt": 0, "completion": 0}
+        model = self.model
+        try:
+            for chunk in self.llm.stream(messages, **kwargs):
+                model = answered_by(chunk, model)
+                for key, value in token_usage(chunk).items():
+                    usage[key] += value
+                yield chunk
+        except Exception as exc:
+            self.metrics.record_call(self.agent, model, time.perf_counter() - started, usage, exc, True)
+            raise
+        self.metrics.record_call(self.agent, model, time.perf_counter() - started, usage, streamed=True)
+
+    async def astream(self, messages, **kwargs: Any) -> AsyncIterator[Any]:
+        started = time.perf_counter()
+        usage = {"prompt": 0, "completion": 0}
+        model = self.model
+        try:
+            async for chunk in self.llm.astream(messages, **kwargs):
+                model = answered_by(chunk, model)
+                for key, value in token_usage(chunk).items():
+                    usage[key] += value
+                yield chunk
+        except Exception as exc:
+            self.metrics.record_call(self.agent, model, time.perf_counter() - started, usage, exc, True)
+            raise
+        self.metrics.record_call(self.agent, model, time.perf_counter() - started, usage, streamed=True)
+
+def configure_call_log(path: str, max_bytes: int = 10 * 1024 * 1024, backup_count: int = 5) -> None:
+    """Включает журнал вызовов LLM в JSONL с ротацией по размеру"""
+    handler = RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8")
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    call_logger.addHandler(handler)
+    call_logger.setLevel(logging.INFO)
+    call_logger.propagate = False
+
+def start_metrics_server(port: int, metrics: LLMMetrics = METRICS) -> ThreadingHTTPServer:
+    """Запускает в фоне HTTP-эндпоинт /metrics для Prometheus"""
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path != "/metrics":
+                self.send_error(404)
+                return
+            body = metrics.render_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("0.0.0.0", port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    return server
@@ -0,0 +1,78 @@
+import json
+import re
+from typing import Any, Dict, Iterable, List, Optional
+
+# Висячие запятые и комментарии, которые модель иногда оставляет в JSON
+_TRAILING_COMMA = re.compile(r',\s*([}\]])')
+_LINE_COMMENT = re.compile(r'^\s*//.*$', re.MULTILINE)
+
+def _loads_lenient(text: str) -> Optional[Any]:
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        pass
+    cleaned = _TRAILING_COMMA.sub(r'\1', _LINE_COMMENT.sub('', text))
+    try:
+        return json.loads(cleaned)
+    except json.JSONDecodeError:
+        return None
+
+class JSONStreamParser:
+    """Инкрементальный парсер JSON-объектов в потоке текста.
+
+    Отслеживает баланс фигурных скобок с учетом строк и экранирования, поэтому
+    работает за один проход по тексту и не спотыкается о скобки внутри строк или
+    о лишние скобки вокруг объекта. Завершенные объекты отдаются сразу, не дожидаясь
+    конца ответа модели.
+    """
+
+    def __init__(self):
+        self._buffer: List[str] = []
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+
+    def feed(self, chunk: str) -> List[Dict[str, Any]]:
+        """Принимает очередной фрагмент текста и возвращает завершенные в нем объекты"""
+        objects = []
+        for char in chunk:
+            if self._depth == 0:
+                if char == '{':
+                    self._depth = 1
+                    self._buffer = [char]
+                # Текст и лишние закрывающие скобки вне объекта пропускаем
+                continue
+
+            self._buffer.append(char)
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == '\\':
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char == '{':
+                self._depth += 1
+            elif char == '}':
+                self._depth -= 1
+                if self._depth == 0:
+                    data = _loads_lenient("".join(self._buffer))
+                    self._buffer = []
+                    if isinstance(data, dict):
+                        objects.append(data)
+        return objects
+
+def extract_json_objects(chunks: Iterable[str]) -> List[Dict[str, Any]]:
+    """Все JSON-объекты верхнего уровня из текста или потока фрагментов"""
+    parser = JSONStreamParser()
+    objects = []
+    for chunk in chunks:
+        objects.extend(parser.feed(chunk))
+    return objects
+
+def extract_json(text: str) -> Optional[Dict[str, Any]]:
+    """Первый JSON-объект в тексте"""
+    objects = extract_json_objects([text])
+    return objects[0] if objects else None
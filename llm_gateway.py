@@ -0,0 +1,282 @@
+import asyncio
+import random
+import sys
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Any, AsyncIterator, Callable, Deque, Iterator, Optional
+
+# Коды ответа, после которых запрос имеет смысл повторить
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+def _status_code(exc: BaseException) -> Optional[int]:
+    """Достает HTTP-код из исключения клиента GigaChat или httpx"""
+    for attr in ("status_code", "status"):
+        code = getattr(exc, attr, None)
+        if isinstance(code, int):
+            return code
+    response = getattr(exc, "response", None)
+    code = getattr(response, "status_code", None)
+    if isinstance(code, int):
+        return code
+    # gigachat.exceptions.ResponseError(url, status_code, content, headers)
+    if len(exc.args) >= 2 and isinstance(exc.args[1], int):
+        return exc.args[1]
+    return None
+
+def is_retryable(exc: BaseException) -> bool:
+    """Определяет, стоит ли повторять запрос после ошибки"""
+    if isinstance(exc, (ConnectionError, TimeoutError)):
+        return True
+    # Клиент GigaChat работает через httpx, сетевые ошибки которого не наследуют встроенные.
+    # Исключение httpx возможно, только если httpx уже загружен, поэтому модуль не импортируем
+    httpx = sys.modules.get("httpx")
+    if httpx is not None and isinstance(
+        exc, (httpx.TimeoutException, httpx.NetworkError, httpx.RemoteProtocolError)
+    ):
+        return True
+    return _status_code(exc) in RETRYABLE_STATUS_CODES
+
+class TokenBucket:
+    """Ограничитель частоты запросов по алгоритму token bucket"""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _take(self) -> float:
+        """Берет токен и возвращает 0 или сколько ждать до следующего токена"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            return (1 - self._tokens) / self.rate
+
+    def acquire(self) -> None:
+        """Блокирует вызывающий поток, пока не появится свободный токен"""
+        if not self.rate:
+            return
+        wait = self._take()
+        while wait:
+            time.sleep(wait)
+            wait = self._take()
+
+    async def aacquire(self) -> None:
+        """Асинхронная версия acquire, не блокирующая event loop"""
+        if not self.rate:
+            return
+        wait = self._take()
+        while wait:
+            await asyncio.sleep(wait)
+            wait = self._take()
+
+class _AsyncTicket:
+    """Место корутины в очереди FairScheduler: слот передается в ее event loop"""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+        self.future = loop.create_future()
+        self.granted = False
+
+    def set(self) -> None:
+        # Вызывается под блокировкой планировщика из любого потока
+        self.granted = True
+        self.loop.call_soon_threadsafe(self._grant)
+
+    def _grant(self) -> None:
+        if not self.future.done():
+            self.future.set_result(None)
+
+class FairScheduler:
+    """Глобальный лимит одновременных запросов с честной очередью по сессиям.
+
+    Свободные слоты раздаются сессиям по кругу, поэтому одна сессия с большим числом
+    запросов не может занять все слоты и задержать остальных пользователей.
+    """
+
+    def __init__(self, max_concurrency: int):
+        self.max_concurrency = max(1, max_concurrency)
+        self._active = 0
+        self._queues: "OrderedDict[str, Deque[threading.Event]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def acquire(self, session_id: str) -> None:
+        ticket = threading.Event()
+        with self._lock:
+            self._queues.setdefault(session_id, deque()).append(ticket)
+            self._dispatch()
+        ticket.wait()
+
+    async def aacquire(self, session_id: str) -> None:
+        """Ожидание слота без блокировки event loop.
+
+        Если ожидающую задачу отменили, ее место убирается из очереди, а слот,
+        выданный одновременно с отменой, сразу возвращается.
+        """
+        ticket = _AsyncTicket(asyncio.get_running_loop())
+        with self._lock:
+            self._queues.setdefault(session_id, deque()).append(ticket)
+            self._dispatch()
+        try:
+            await ticket.future
+        except asyncio.CancelledError:
+            with self._lock:
+                granted = ticket.granted
+                queue = self._queues.get(session_id)
+                if not granted and queue is not None:
+                    queue.remove(ticket)
+                    if not queue:
+                        del self._queues[session_id]
+            if granted:
+                self.release()
+            raise
+
+    def release(self) -> None:
+        with self._lock:
+            self._active -= 1
+            self._dispatch()
+
+    @property
+    def waiting(self) -> int:
+        with self._lock:
+            return sum(len(queue) for queue in self._queues.values())
+
+    def _dispatch(self) -> None:
+        while self._active < self.max_concurrency and self._queues:
+            session_id, queue = self._queues.popitem(last=False)
+            queue.popleft().set()
+            self._active += 1
+            if queue:
+                # Сессия с оставшимися запросами встает в конец круга
+                self._queues[session_id] = queue
+
+class LLMGateway:
+    """Общий для процесса шлюз к LLM: лимит параллелизма, rate limit и повторы.
+
+    Все агенты всех сессий ходят в модель через один экземпляр шлюза.
+    """
+
+    def __init__(self, max_concurrency: int = 8, rate_limit: float = 0, burst: int = 10,
+                 max_retries: int = 3, backoff_base: float = 0.5, backoff_max: float = 10.0,
+                 on_retry: Optional[Callable[[Any], None]] = None):
+        self.scheduler = FairScheduler(max_concurrency)
+        self.on_retry = on_retry
+        self.bucket = TokenBucket(rate_limit, burst)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+    def bind(self, llm, session_id: str, max_retries: Optional[int] = None) -> "GatewayLLM":
+        """Возвращает модель, все вызовы которой идут через шлюз от имени сессии.
+
+        max_retries переопределяет число повторов шлюза для этой модели, например 0 для
+        модели с запасной, чтобы сразу переключаться на запасную вместо ожидания.
+        """
+        return GatewayLLM(self, llm, session_id, max_retries)
+
+    def acquire(self, session_id: str) -> None:
+        self.scheduler.acquire(session_id)
+        self.bucket.acquire()
+
+    async def aacquire(self, session_id: str) -> None:
+        await self.scheduler.aacquire(session_id)
+        try:
+            await self.bucket.aacquire()
+        except BaseException:
+            self.scheduler.release()
+            raise
+
+    def release(self) -> None:
+        self.scheduler.release()
+
+    def backoff(self, attempt: int) -> float:
+        """Задержка перед повтором: экспоненциальная с полным джиттером"""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def should_retry(self, llm, exc: BaseException, attempt: int, max_retries: Optional[int] = None) -> bool:
+        if max_retries is None:
+            max_retries = self.max_retries
+        retry = attempt < max_retries and is_retryable(exc)
+        if retry and self.on_retry is not None:
+            self.on_retry(llm)
+        return retry
+
+class GatewayLLM:
+    """Обертка над чат-моделью, направляющая вызовы через LLMGateway"""
+
+    def __init__(self, gateway: LLMGateway, llm, session_id: str, max_retries: Optional[int] = None):
+        self.gateway = gateway
+        self.llm = llm
+        self.session_id = session_id
+        self.max_retries = max_retries
+
+    def invoke(self, messages, **kwargs: Any):
+        attempt = 0
+        while True:
+            self.gateway.acquire(self.session_id)
+            try:
+                return self.llm.invoke(messages, **kwargs)
+            except Exception as exc:
+                if not self.gateway.should_retry(self.llm, exc, attempt, self.max_retries):
+                    raise
+            finally:
+                self.gateway.release()
+            time.sleep(self.gateway.backoff(attempt))
+            attempt += 1
+
+    async def ainvoke(self, messages, **kwargs: Any):
+        attempt = 0
+        while True:
+            await self.gateway.aacquire(self.session_id)
+            try:
+                return await self.llm.ainvoke(messages, **kwargs)
+            except Exception as exc:
+                if not self.gateway.should_retry(self.llm, exc, attempt, self.max_retries):
+                    raise
+            finally:
+                self.gateway.release()
+            await asyncio.sleep(self.gateway.backoff(attempt))
+            attempt += 1
+
+    def stream(self, messages, **kwargs: Any) -> Iterator[Any]:
+        attempt = 0
+        while True:
+            started = False
+            self.gateway.acquire(self.session_id)
+            try:
+                for chunk in self.llm.stream(messages, **kwargs):
+                    started = True
+                    yield chunk
+                return
+            except Exception as exc:
+                # После первого фрагмента повтор исказил бы уже показанный ответ
+                if started or not self.gateway.should_retry(self.llm, exc, attempt, self.max_retries):
+                    raise
+            finally:
+                self.gateway.release()
+            time.sleep(self.gateway.backoff(attempt))
+            attempt += 1
+
+    async def astream(self, messages, **kwargs: Any) -> AsyncIterator[Any]:
+        attempt = 0
+        while True:
+            started = False
+            await self.gateway.aacquire(self.session_id)
+            try:
+                async for chunk in self.llm.astream(messages, **kwargs):
+                    started = True
+                    yield chunk
+                return
+            except Exception as exc:
+                if started or not self.gateway.should_retry(self.llm, exc, attempt, self.max_retries):
+                    raise
+            finally:
+                self.gateway.release()
+            await asyncio.sleep(self.gateway.backoff(attempt))
+            attempt += 1
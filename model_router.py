@@ -0,0 +1,229 @@
+import math
+import threading
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Callable, Deque, Dict, Iterator, Optional
+
+from instrumentation import ANSWERED_BY, model_name
+from llm_gateway import is_retryable
+
+# Параметры маршрута, которые агент может переопределить относительно маршрута по умолчанию
+ROUTE_FIELDS = ("model", "timeout", "max_tokens", "temperature", "fallback", "slo_seconds")
+
+def is_timeout(exc: BaseException) -> bool:
+    """Таймаут запроса, в том числе httpx.TimeoutException клиента GigaChat"""
+    return isinstance(exc, TimeoutError) or "timeout" in type(exc).__name__.lower()
+
+class ModelRoute:
+    """Модель и параметры генерации для одного агента"""
+
+    def __init__(self, model: str, timeout: Optional[float] = None, max_tokens: Optional[int] = None,
+                 temperature: Optional[float] = None, fallback: Optional[str] = None,
+                 slo_seconds: Optional[float] = None):
+        self.model = model
+        self.timeout = timeout
+        self.max_tokens = max_tokens
+        self.temperature = temperature
+        self.fallback = fallback
+        self.slo_seconds = slo_seconds
+
+    def client_params(self) -> Dict[str, Any]:
+        """Заданные параметры клиента модели без пустых значений"""
+        params = {"timeout": self.timeout, "max_tokens": self.max_tokens, "temperature": self.temperature}
+        return {name: value for name, value in params.items() if value is not None}
+
+class LatencyBudget:
+    """Бюджет задержки этапа по скользящему окну последних вызовов основной модели.
+
+    Если p95 задержки в окне превышает SLO, этап на cooldown_seconds считается
+    деградировавшим и запросы уходят на запасную модель; после этого основная
+    модель снова получает запросы и окно набирается заново.
+    """
+
+    def __init__(self, slo_seconds: Optional[float], window: int = 20, cooldown_seconds: float = 60.0,
+                 min_samples: int = 5):
+        self.slo_seconds = slo_seconds
+        self.cooldown_seconds = cooldown_seconds
+        self.min_samples = min(min_samples, window)
+        self._latencies: Deque[float] = deque(maxlen=window)
+        self._degraded_until = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, latency: float) -> bool:
+        """Учитывает задержку вызова; True, если этап только что вышел за бюджет"""
+        if not self.slo_seconds:
+            return False
+        with self._lock:
+            self._latencies.append(latency)
+            if len(self._latencies) < self.min_samples:
+                return False
+            ordered = sorted(self._latencies)
+            p95 = ordered[max(0, math.ceil(0.95 * len(ordered)) - 1)]
+            if p95 <= self.slo_seconds:
+                return False
+            self._degraded_until = time.monotonic() + self.cooldown_seconds
+            self._latencies.clear()
+            return True
+
+    @property
+    def degraded(self) -> bool:
+        return time.monotonic() < self._degraded_until
+
+class ModelRouter:
+    """Маршрутизация агентов по моделям согласно конфигурации.
+
+    Хранит маршруты агентов и общие для процесса бюджеты задержки этапов, поэтому
+    медленная основная модель переключает на запасную сразу все сессии.
+    """
+
+    def __init__(self, default: ModelRoute, routes: Optional[Dict[str, ModelRoute]] = None,
+                 slo_window: int = 20, cooldown_seconds: float = 60.0):
+        self.default = default
+        self.routes = routes or {}
+        self.slo_window = slo_window
+        self.cooldown_seconds = cooldown_seconds
+        self._budgets: Dict[str, LatencyBudget] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any], default_model: str = "GigaChat-2-Max") -> "ModelRouter":
+        """Создает маршрутизатор из секции routing конфигурации"""
+        default_params = {"model": default_model}
+        default_params.update({k: v for k, v in (config.get("default") or {}).items() if k in ROUTE_FIELDS})
+        routes = {}
+        for agent, params in (config.get("agents") or {}).items():
+            merged = dict(default_params)
+            merged.update({k: v for k, v in (params or {}).items() if k in ROUTE_FIELDS and v is not None})
+            routes[agent] = ModelRoute(**merged)
+        return cls(
+            ModelRoute(**default_params),
+            routes,
+            slo_window=config.get("slo_window", 20),
+            cooldown_seconds=config.get("cooldown_seconds", 60)
+        )
+
+    def route(self, agent: str) -> ModelRoute:
+        return self.routes.get(agent, self.default)
+
+    def budget(self, agent: str) -> LatencyBudget:
+        with self._lock:
+            if agent not in self._budgets:
+                self._budgets[agent] = LatencyBudget(
+                    self.route(agent).slo_seconds, self.slo_window, self.cooldown_seconds
+                )
+            return self._budgets[agent]
+
+class RoutedLLM:
+    """Обертка над основной моделью агента с переключением на запасную.
+
+    Запрос уходит на запасную модель, если основная ответила ошибкой 429/5xx или
+    таймаутом, а также пока этап вышел за бюджет задержки. Потоковый ответ
+    переключается, только если основная модель не успела отдать ни одного фрагмента.
+    Ответы запасной модели помечаются ее именем (ANSWERED_BY в response_metadata),
+    чтобы кэш не сохранял их под ключом основной модели, а метрики учитывали за запасной.
+    """
+
+    def __init__(self, llm, fallback, agent: str, budget: LatencyBudget,
+                 on_fallback: Optional[Callable[[str, str], None]] = None):
+        self.llm = llm
+        self.fallback = fallback
+        self.agent = agent
+        self.budget = budget
+        self.on_fallback = on_fallback
+        self.model = model_name(llm)
+        self.fallback_model = model_name(fallback)
+
+    def _switch(self, reason: str) -> None:
+        if self.on_fallback is not None:
+            self.on_fallback(self.agent, reason)
+
+    def _mark(self, message):
+        message.response_metadata = dict(message.response_metadata or {}, **{ANSWERED_BY: self.fallback_model})
+        return message
+
+    def _fallback_stream(self, messages, **kwargs: Any) -> Iterator[Any]:
+        # Помечается только первый фрагмент: строковые метаданные фрагментов при сложении склеиваются
+        for i, chunk in enumerate(self.fallback.stream(messages, **kwargs)):
+            yield self._mark(chunk) if i == 0 else chunk
+
+    async def _afallback_stream(self, messages, **kwargs: Any) -> AsyncIterator[Any]:
+        first = True
+        async for chunk in self.fallback.astream(messages, **kwargs):
+            yield self._mark(chunk) if first else chunk
+            first = False
+
+    def _degraded(self) -> bool:
+        if self.budget.degraded:
+            self._switch("slo")
+            return True
+        return False
+
+    def _failed(self, exc: BaseException, started: float) -> bool:
+        """Учитывает ошибку основной модели; True, если запрос стоит отдать запасной"""
+        self.budget.observe(time.perf_counter() - started)
+        if is_timeout(exc) or is_retryable(exc):
+            self._switch("timeout" if is_timeout(exc) else "error")
+            return True
+        return False
+
+    def invoke(self, messages, **kwargs: Any):
+        if self._degraded():
+            return self._mark(self.fallback.invoke(messages, **kwargs))
+        started = time.perf_counter()
+        try:
+            response = self.llm.invoke(messages, **kwargs)
+        except Exception as exc:
+            if not self._failed(exc, started):
+                raise
+            return self._mark(self.fallback.invoke(messages, **kwargs))
+        self.budget.observe(time.perf_counter() - started)
+        return response
+
+    async def ainvoke(self, messages, **kwargs: Any):
+        if self._degraded():
+            return self._mark(await self.fallback.ainvoke(messages, **kwargs))
+        started = time.perf_counter()
+        try:
+            response = await self.llm.ainvoke(messages, **kwargs)
+        except Exception as exc:
+            if not self._failed(exc, started):
+                raise
+            return self._mark(await self.fallback.ainvoke(messages, **kwargs))
+        self.budget.observe(time.perf_counter() - started)
+        return response
+
+    def stream(self, messages, **kwargs: Any) -> Iterator[Any]:
+        if self._degraded():
+            yield from self._fallback_stream(messages, **kwargs)
+            return
+        started = time.perf_counter()
+        streamed = False
+        try:
+            for chunk in self.llm.stream(messages, **kwargs):
+                streamed = True
+                yield chunk
+        except Exception as exc:
+            if streamed or not self._failed(exc, started):
+                raise
+            yield from self._fallback_stream(messages, **kwargs)
+            return
+        self.budget.observe(time.perf_counter() - started)
+
+    async def astream(self, messages, **kwargs: Any) -> AsyncIterator[Any]:
+        if self._degraded():
+            async for chunk in self._afallback_stream(messages, **kwargs):
+                yield chunk
+            return
+        started = time.perf_counter()
+        streamed = False
+        try:
+            async for chunk in self.llm.astream(messages, **kwargs):
+                streamed = True
+                yield chunk
+        except Exception as exc:
+            if streamed or not self._failed(exc, started):
+                raise
+            async for chunk in self._afallback_stream(messages, **kwargs):
+                yield chunk
+            return
+        self.budget.observe(time.perf_counter() - started)
@@ -1,314 +1,74 @@
 import streamlit as st
-import json
-import io
+import time
+import uuid
 from datetime import datetime
-from docx import Document
-from docx.shared import Inches
-from docx.enum.text import WD_ALIGN_PARAGRAPH
-from docx.oxml.shared import OxmlElement, qn
-from langchain_core.messages import HumanMessage, SystemMessage, AIMessage
-from langchain_community.chat_models import GigaChat
-from langchain.agents import AgentExecutor, create_openai_functions_agent
-from langchain.tools import BaseTool
-from langchain.schema import BaseMessage
-from typing import List, Dict, Any, Optional
-import re
+from typing import Any, Dict
 
 from config import CONFIG
+from agents import REPORT_PARTS, SituationGenerator
+from conversation import message_label
+from app_resources import (TrainingSession, agent_llm, background_executor, get_active_sessions,
+                           get_render_cache, get_report_jobs, get_situation_pool, start_metrics_exporters)
+from instrumentation import METRICS
+from report_export import FORMATS
 
-# Инициализация GigaChat
-giga = GigaChat(
-    scope='GIGACHAT_API_CORP',
-    credentials=CONFIG["token"]["gigachat"],
-    verify_ssl_certs=False,
-    model="GigaChat-2-Max"
-)
+def start_report_job(session: TrainingSession) -> None:
+    """Завершает диалог и ставит генерацию отчета в фоновую очередь"""
+    session.end()
+    st.session_state.pending_end_check = None
+    st.session_state.report_job_id = get_report_jobs().submit(
+        session.report_generator,
+        session.conversation_history,
+        list(REPORT_PARTS)
+    )
 
-class SituationGenerator:
-    """Агент для создания ситуаций и ролей"""
-    
-    def __init__(self, llm):
-        self.llm = llm
-    
-    def generate_situation(self) -> Dict[str, str]:
-        """Генерирует случайную ситуацию для переговоров"""
-        system_prompt = """
-        Ты эксперт по созданию реалистичных сценариев для тренировки навыков переговоров.
-        Создай интересную и сложную ситуацию для переговоров между менеджером и клиентом.
-        Ситуация должна быть реалистичной и требовать навыков убеждения и работы с возражениями.
-        """
-        
-        user_prompt = """
-        Создай ситуацию для тренировки переговоров. Верни ответ в формате JSON:
-        {
-            "situation": "описание ситуации",
-            "manager_role": "роль менеджера",
-            "client_role": "роль клиента",
-            "manager_goal": "цель менеджера",
-            "client_concerns": "основные возражения клиента",
-            "product": "продукт или услуга",
-            "context": "дополнительный контекст"
-        }
-        """
-        
-        messages = [
-            SystemMessage(content=system_prompt),
-            HumanMessage(content=user_prompt)
-        ]
-        
-        response = self.llm.invoke(messages)
-        
-        try:
-            # Извлекаем JSON из ответа
-            json_match = re.search(r'\{.*\}', response.content, re.DOTALL)
-            if json_match:
-                return json.loads(json_match.group())
-            else:
-                # Fallback если JSON не найден
-                return self._create_default_situation()
-        except:
-            return self._create_default_situation()
-    
-    def _create_default_situation(self) -> Dict[str, str]:
-        return {
-            "situation": "Переговоры по внедрению CRM-системы в среднюю компанию",
-            "manager_role": "Менеджер по продажам IT-решений",
-            "client_role": "Директор по развитию компании",
-            "manager_goal": "Продать CRM-систему стоимостью 500,000 рублей",
-            "client_concerns": "Высокая стоимость, сложность внедрения, сомнения в ROI",
-            "product": "CRM-система для автоматизации продаж",
-            "context": "Клиент уже использует простую систему учета, но хочет масштабировать бизнес"
-        }
+# Названия частей отчета для сообщений об ошибках
+REPORT_PART_TITLES = {
+    "assessment": "Оценка переговоров",
+    "development": "Рекомендации по развитию"
+}
 
-class DialogueAgent:
-    """Агент для ведения диалога от имени клиента"""
-    
-    def __init__(self, llm, situation: Dict[str, str]):
-        self.llm = llm
-        self.situation = situation
-    
-    def respond_as_client(self, conversation_history: List[Dict[str, str]]) -> str:
-        """Отвечает от имени клиента на основе истории диалога"""
-        system_prompt = f"""
-        Ты играешь роль клиента в переговорах. Твоя роль: {self.situation['client_role']}.
-        Ситуация: {self.situation['situation']}
-        Твои основные возражения: {self.situation['client_concerns']}
-        
-        Веди себя как реальный клиент:
-        - Задавай сложные вопросы
-        - Выражай сомнения и возражения
-        - Будь скептичен к обещаниям
-        - Требуй конкретные доказательства
-        - Не соглашайся легко
-        - Отвечай кратко и по делу
-        """
-        
-        # Формируем историю диалога
-        history_text = ""
-        for msg in conversation_history:
-            if msg['role'] == 'manager':
-                history_text += f"Менеджер: {msg['content']}\n"
-            elif msg['role'] == 'client':
-                history_text += f"Клиент: {msg['content']}\n"
-        
-        user_prompt = f"""
-        История диалога:
-        {history_text}
-        
-        Ответь как клиент на последнее сообщение менеджера. Будь реалистичным и сложным собеседником.
-        """
-        
-        messages = [
-            SystemMessage(content=system_prompt),
-            HumanMessage(content=user_prompt)
-        ]
-        
-        response = self.llm.invoke(messages)
-        return response.content.strip()
+def resolve_end_check(session: TrainingSession) -> None:
+    """Учитывает решение фоновой проверки завершения, как только оно готово"""
+    pending_end_check = st.session_state.pending_end_check
+    if pending_end_check is None or not pending_end_check.done():
+        return
+    st.session_state.pending_end_check = None
+    # Ошибка проверки не завершает диалог: после следующего ответа клиента он проверяется заново
+    if pending_end_check.exception() is None and pending_end_check.result() and not session.dialogue_ended:
+        start_report_job(session)
 
-class DialogueEndDetector:
-    """Агент для определения завершения диалога"""
-    
-    def __init__(self, llm, situation: Dict[str, str]):
-        self.llm = llm
-        self.situation = situation
-    
-    def should_end_dialogue(self, conversation_history: List[Dict[str, str]]) -> bool:
-        """Определяет, пора ли завершить диалог"""
-        if len(conversation_history) < 4:  # Минимум 4 сообщения
-            return False
-        
-        system_prompt = f"""
-        Ты эксперт по анализу переговоров. Определи, достигнута ли цель переговоров.
-        Цель менеджера: {self.situation['manager_goal']}
-        
-        Диалог должен завершиться, если:
-        1. Клиент согласился на предложение менеджера
-        2. Клиент категорически отказался и дальнейшие переговоры бессмысленны
-        3. Достигнут компромисс, удовлетворяющий обе стороны
-        4. Диалог зашел в тупик и требует перерыва
-        """
-        
-        history_text = ""
-        for msg in conversation_history:
-            if msg['role'] == 'manager':
-                history_text += f"Менеджер: {msg['content']}\n"
-            elif msg['role'] == 'client':
-                history_text += f"Клиент: {msg['content']}\n"
-        
-        user_prompt = f"""
-        История диалога:
-        {history_text}
-        
-        Ответь только "ДА" если диалог пора завершать, или "НЕТ" если нужно продолжить.
-        """
-        
-        messages = [
-            SystemMessage(content=system_prompt),
-            HumanMessage(content=user_prompt)
-        ]
-        
-        response = self.llm.invoke(messages)
-        return "ДА" in response.content.upper()
-
-class ReportGenerator:
-    """Агент для создания отчета по результатам переговоров"""
-    
-    def __init__(self, llm, situation: Dict[str, str]):
-        self.llm = llm
-        self.situation = situation
-    
-    def generate_report(self, conversation_history: List[Dict[str, str]]) -> Dict[str, str]:
-        """Генерирует подробный отчет по переговорам"""
-        system_prompt = f"""
-        Ты эксперт по анализу переговоров. Создай подробный отчет по результатам диалога.
-        Ситуация: {self.situation['situation']}
-        Цель менеджера: {self.situation['manager_goal']}
-        Продукт: {self.situation['product']}
-        
-        Проанализируй только сообщения менеджера и дай рекомендации по улучшению навыков.
-        """
-        
-        # Извлекаем только сообщения менеджера
-        manager_messages = [msg['content'] for msg in conversation_history if msg['role'] == 'manager']
-        manager_text = "\n".join([f"Сообщение {i+1}: {msg}" for i, msg in enumerate(manager_messages)])
-        
-        user_prompt = f"""
-        Сообщения менеджера:
-        {manager_text}
-        
-        Создай отчет в формате JSON:
-        {{
-            "summary": "краткое резюме переговоров",
-            "strengths": ["сильные стороны менеджера"],
-            "weaknesses": ["слабые стороны и ошибки"],
-            "recommendations": ["конкретные рекомендации по улучшению"],
-            "growth_areas": ["области для развития"],
-            "techniques_used": ["использованные техники"],
-            "missed_opportunities": ["упущенные возможности"],
-            "overall_rating": "общая оценка от 1 до 10"
-        }}
-        """
-        
-        messages = [
-            SystemMessage(content=system_prompt),
-            HumanMessage(content=user_prompt)
-        ]
-        
-        response = self.llm.invoke(messages)
-        
-        try:
-            json_match = re.search(r'\{.*\}', response.content, re.DOTALL)
-            if json_match:
-                return json.loads(json_match.group())
-            else:
-                return self._create_default_report()
-        except:
-            return self._create_default_report()
-    
-    def _create_default_report(self) -> Dict[str, str]:
-        return {
-            "summary": "Проведены переговоры по продаже продукта",
-            "strengths": ["Активное слушание", "Профессиональный подход"],
-            "weaknesses": ["Недостаточно аргументации", "Слабая работа с возражениями"],
-            "recommendations": ["Изучить техники работы с возражениями", "Подготовить больше аргументов"],
-            "growth_areas": ["Психология продаж", "Техники убеждения"],
-            "techniques_used": ["Вопросы", "Презентация"],
-            "missed_opportunities": ["Не использовал социальные доказательства"],
-            "overall_rating": "6"
-        }
+def render_report_sections(sections: Dict[str, Any]) -> None:
+    """Показывает уже готовые разделы отчета"""
+    titles = {
+        "summary": "Резюме переговоров",
+        "strengths": "Сильные стороны",
+        "weaknesses": "Области для улучшения",
+        "recommendations": "Рекомендации",
+        "growth_areas": "Области для развития",
+        "techniques_used": "Использованные техники",
+        "missed_opportunities": "Упущенные возможности"
+    }
+    for field, title in titles.items():
+        if field not in sections:
+            continue
+        st.markdown(f"**{title}**")
+        value = sections[field]
+        if isinstance(value, list):
+            st.markdown("\n".join(f"- {item}" for item in value))
+        else:
+            st.write(value)
 
-def create_docx_report(report_data: Dict[str, Any], situation: Dict[str, str], conversation_history: List[Dict[str, str]]) -> bytes:
-    """Создает отчет в формате DOCX"""
-    doc = Document()
-    
-    # Заголовок
-    title = doc.add_heading('Отчет по тренировке переговоров', 0)
-    title.alignment = WD_ALIGN_PARAGRAPH.CENTER
-    
-    # Информация о сессии
-    doc.add_heading('Информация о сессии', level=1)
-    doc.add_paragraph(f"Дата: {datetime.now().strftime('%d.%m.%Y %H:%M')}")
-    doc.add_paragraph(f"Ситуация: {situation['situation']}")
-    doc.add_paragraph(f"Продукт: {situation['product']}")
-    doc.add_paragraph(f"Цель: {situation['manager_goal']}")
-    
-    # Резюме
-    doc.add_heading('Резюме переговоров', level=1)
-    doc.add_paragraph(report_data.get('summary', 'Резюме не доступно'))
-    
-    # Сильные стороны
-    doc.add_heading('Сильные стороны', level=1)
-    strengths = report_data.get('strengths', [])
-    for strength in strengths:
-        doc.add_paragraph(f"• {strength}", style='List Bullet')
-    
-    # Области для улучшения
-    doc.add_heading('Области для улучшения', level=1)
-    weaknesses = report_data.get('weaknesses', [])
-    for weakness in weaknesses:
-        doc.add_paragraph(f"• {weakness}", style='List Bullet')
-    
-    # Рекомендации
-    doc.add_heading('Рекомендации', level=1)
-    recommendations = report_data.get('recommendations', [])
-    for rec in recommendations:
-        doc.add_paragraph(f"• {rec}", style='List Bullet')
-    
-    # Области роста
-    doc.add_heading('Области для развития', level=1)
-    growth_areas = report_data.get('growth_areas', [])
-    for area in growth_areas:
-        doc.add_paragraph(f"• {area}", style='List Bullet')
-    
-    # Использованные техники
-    doc.add_heading('Использованные техники', level=1)
-    techniques = report_data.get('techniques_used', [])
-    for technique in techniques:
-        doc.add_paragraph(f"• {technique}", style='List Bullet')
-    
-    # Упущенные возможности
-    doc.add_heading('Упущенные возможности', level=1)
-    missed = report_data.get('missed_opportunities', [])
-    for opportunity in missed:
-        doc.add_paragraph(f"• {opportunity}", style='List Bullet')
-    
-    # Общая оценка
-    doc.add_heading('Общая оценка', level=1)
-    rating = report_data.get('overall_rating', 'Не оценено')
-    doc.add_paragraph(f"Оценка: {rating}/10")
-    
-    # История диалога
-    doc.add_heading('История диалога', level=1)
-    for i, msg in enumerate(conversation_history, 1):
-        role = "Менеджер" if msg['role'] == 'manager' else "Клиент"
-        doc.add_paragraph(f"{i}. {role}: {msg['content']}")
-    
-    # Сохраняем в байты
-    docx_bytes = io.BytesIO()
-    doc.save(docx_bytes)
-    docx_bytes.seek(0)
-    return docx_bytes.getvalue()
+def render_metrics_panel() -> None:
+    """Панель администратора с метриками вызовов LLM"""
+    with st.expander("🛠️ Метрики LLM"):
+        rows = METRICS.snapshot()
+        if rows:
+            st.dataframe(rows, use_container_width=True, hide_index=True)
+        else:
+            st.caption("Вызовов модели пока не было")
+        if METRICS.retries:
+            st.write("**Повторы запросов:**", dict(METRICS.retries))
 
 # Streamlit интерфейс
 def main():
@@ -321,71 +81,101 @@ def main():
     st.title("💼 Тренажер переговоров с ИИ")
     st.markdown("---")
     
-    # Инициализация сессии
-    if 'conversation_history' not in st.session_state:
-        st.session_state.conversation_history = []
-    if 'situation' not in st.session_state:
-        st.session_state.situation = None
-    if 'dialogue_agent' not in st.session_state:
-        st.session_state.dialogue_agent = None
-    if 'end_detector' not in st.session_state:
-        st.session_state.end_detector = None
-    if 'report_generator' not in st.session_state:
-        st.session_state.report_generator = None
-    if 'dialogue_ended' not in st.session_state:
-        st.session_state.dialogue_ended = False
-    if 'report_data' not in st.session_state:
-        st.session_state.report_data = None
+    start_metrics_exporters()
+    
+    # Инициализация сессии. Идентификатор тренировки хранится в адресе страницы,
+    # поэтому после обновления страницы или перезапуска сервера она продолжается
+    if 'session_id' not in st.session_state:
+        st.session_state.session_id = st.query_params.get("session") or uuid.uuid4().hex
+    st.query_params["session"] = st.session_state.session_id
+    session_id = st.session_state.session_id
+    session = get_active_sessions().get(session_id)
     if 'message_key' not in st.session_state:
         st.session_state.message_key = 0
     if 'user_message' not in st.session_state:
         st.session_state.user_message = ""
+    if 'pending_end_check' not in st.session_state:
+        st.session_state.pending_end_check = None
+    if 'report_job_id' not in st.session_state:
+        st.session_state.report_job_id = None
+    if 'turn_warnings' not in st.session_state:
+        st.session_state.turn_warnings = []
+    resolve_end_check(session)
     
     # Боковая панель с информацией
     with st.sidebar:
         st.header("📋 Информация о сессии")
         
-        if st.session_state.situation:
+        trainee = st.text_input("👤 Участник", value=session.trainee or "", key=f"trainee_{session_id}")
+        if trainee.strip() and trainee.strip() != session.trainee:
+            session.set_trainee(trainee.strip())
+        
+        if session.situation:
             st.subheader("Текущая ситуация")
-            st.write(f"**Роль:** {st.session_state.situation['manager_role']}")
-            st.write(f"**Продукт:** {st.session_state.situation['product']}")
-            st.write(f"**Цель:** {st.session_state.situation['manager_goal']}")
-            st.write(f"**Возражения клиента:** {st.session_state.situation['client_concerns']}")
+            st.write(f"**Роль:** {session.situation['manager_role']}")
+            st.write(f"**Продукт:** {session.situation['product']}")
+            st.write(f"**Цель:** {session.situation['manager_goal']}")
+            if session.is_group:
+                st.write("**Участники со стороны клиента:**")
+                for stakeholder in session.situation['stakeholders']:
+                    st.write(f"- {stakeholder['role']}: {stakeholder.get('concerns', '')}")
+            else:
+                st.write(f"**Возражения клиента:** {session.situation['client_concerns']}")
         
         st.markdown("---")
         
         if st.button("🔄 Новая тренировка", use_container_width=True):
-            st.session_state.conversation_history = []
-            st.session_state.situation = None
-            st.session_state.dialogue_agent = None
-            st.session_state.end_detector = None
-            st.session_state.report_generator = None
-            st.session_state.dialogue_ended = False
-            st.session_state.report_data = None
+            # Прошлая тренировка остается в хранилище, новая получает свой идентификатор
+            get_active_sessions().discard(session_id)
+            st.session_state.session_id = uuid.uuid4().hex
+            st.query_params["session"] = st.session_state.session_id
             st.session_state.message_key = 0
             st.session_state.user_message = ""
+            st.session_state.pending_end_check = None
+            st.session_state.report_job_id = None
+            st.session_state.turn_warnings = []
             st.rerun()
+        
+        if CONFIG.get("metrics", {}).get("admin_panel", False):
+            render_metrics_panel()
     
     # Основная область
     col1, col2 = st.columns([2, 1])
     
     with col1:
-        if not st.session_state.situation:
+        if not session.situation:
             st.info("🎯 Нажмите 'Начать тренировку' чтобы создать новую ситуацию для переговоров")
             
+            stakeholders = st.number_input(
+                "👥 Участников со стороны клиента",
+                min_value=1,
+                max_value=CONFIG.get("group", {}).get("max_stakeholders", 4),
+                value=1
+            )
+            
             if st.button("🚀 Начать тренировку", use_container_width=True):
-                with st.spinner("Создаю ситуацию для тренировки..."):
-                    situation_generator = SituationGenerator(giga)
-                    st.session_state.situation = situation_generator.generate_situation()
-                    st.session_state.dialogue_agent = DialogueAgent(giga, st.session_state.situation)
-                    st.session_state.end_detector = DialogueEndDetector(giga, st.session_state.situation)
-                    st.session_state.report_generator = ReportGenerator(giga, st.session_state.situation)
-                    st.rerun()
+                if stakeholders > 1:
+                    # Пул хранит ситуации с одним клиентом, групповую создаем сразу
+                    with st.spinner("Создаю ситуацию для групповых переговоров..."):
+                        situation = SituationGenerator(
+                            agent_llm(session_id, "situation"), stakeholders=int(stakeholders)
+                        ).generate_situation()
+                else:
+                    pool = get_situation_pool()
+                    situation = pool.pop()
+                    if situation is None:
+                        # Пул еще не успел наполниться - генерируем ситуацию сразу
+                        with st.spinner("Создаю ситуацию для тренировки..."):
+                            situation = SituationGenerator(agent_llm(session_id, "situation")).generate_situation()
+                        pool.mark_served(situation)
+                
+                session.start(situation)
+                st.rerun()
         
         else:
             # Отображение ситуации
             st.subheader("🎭 Ситуация")
-            st.info(st.session_state.situation['situation'])
+            st.info(session.situation['situation'])
             
             # Отображение диалога
             st.subheader("💬 Диалог")
@@ -394,15 +184,21 @@ def main():
             dialogue_container = st.container()
             
             with dialogue_container:
-                for i, msg in enumerate(st.session_state.conversation_history):
+                for i, msg in enumerate(session.conversation_history):
                     if msg['role'] == 'manager':
                         st.markdown(f"**👤 Вы (менеджер):** {msg['content']}")
                     else:
-                        st.markdown(f"**🤖 Клиент:** {msg['content']}")
+                        st.markdown(f"**🤖 {message_label(msg)}:** {msg['content']}")
                     st.markdown("---")
+                # Участники, которые не смогли ответить на последнюю реплику
+                for warning in st.session_state.turn_warnings:
+                    st.warning(warning)
+            
+            # Место для потокового вывода ответа клиента
+            stream_placeholder = st.empty()
             
             # Поле ввода сообщения
-            if not st.session_state.dialogue_ended:
+            if not session.dialogue_ended:
                 user_message = st.text_area(
                     "💭 Ваше сообщение:", 
                     value=st.session_state.user_message,
@@ -418,84 +214,177 @@ def main():
                 with col_btn1:
                     if st.button("📤 Отправить", use_container_width=True):
                         if user_message.strip():
+                            # Незавершенная проверка прошлого хода устарела: сообщение менеджера
+                            # принимается, а после ответа клиента диалог проверяется заново
+                            st.session_state.pending_end_check = None
+                            st.session_state.turn_warnings = []
+                            
                             # Добавляем сообщение менеджера
-                            st.session_state.conversation_history.append({
+                            session.conversation_history.append({
                                 'role': 'manager',
                                 'content': user_message.strip()
                             })
                             
-                            # Получаем ответ клиента
-                            with st.spinner("Клиент думает..."):
-                                client_response = st.session_state.dialogue_agent.respond_as_client(
-                                    st.session_state.conversation_history
+                            if session.is_group:
+                                # Участники отвечают одновременно; каждый ответ выводится,
+                                # как только готов, а в историю ответы идут в порядке участников
+                                with stream_placeholder.container():
+                                    reply_placeholders = [st.empty() for _ in session.dialogue_agent.personas]
+                                    for persona, placeholder in zip(session.dialogue_agent.personas,
+                                                                    reply_placeholders):
+                                        placeholder.caption(f"🤖 {persona.name} печатает...")
+                                    replies = [None] * len(reply_placeholders)
+                                    for index, reply, error in session.dialogue_agent.iter_responses(
+                                        session.conversation_history
+                                    ):
+                                        if error is not None:
+                                            # Ответы остальных участников сохраняются, о сбое сообщаем отдельно
+                                            st.session_state.turn_warnings.append(
+                                                f"{session.dialogue_agent.personas[index].name} не смог ответить: {error}"
+                                            )
+                                            reply_placeholders[index].empty()
+                                            continue
+                                        replies[index] = reply
+                                        reply_placeholders[index].markdown(
+                                            f"**🤖 {reply['speaker']}:** {reply['content']}"
+                                        )
+                                session.conversation_history.extend(
+                                    [reply for reply in replies if reply is not None]
                                 )
+                            else:
+                                # Выводим ответ клиента по мере генерации
+                                with stream_placeholder.container():
+                                    st.markdown("**🤖 Клиент:**")
+                                    client_response = st.write_stream(
+                                        session.dialogue_agent.stream_as_client(
+                                            session.conversation_history
+                                        )
+                                    )
                                 
-                                st.session_state.conversation_history.append({
+                                session.conversation_history.append({
                                     'role': 'client',
-                                    'content': client_response
+                                    'content': client_response.strip()
                                 })
                             
-                            # Проверяем, пора ли завершить диалог
-                            if st.session_state.end_detector.should_end_dialogue(st.session_state.conversation_history):
-                                st.session_state.dialogue_ended = True
-                                with st.spinner("Анализирую результаты..."):
-                                    st.session_state.report_data = st.session_state.report_generator.generate_report(
-                                        st.session_state.conversation_history
-                                    )
+                            # Проверяем, пора ли завершить диалог. Если локальной уверенности не хватает,
+                            # модель проверяет диалог в фоне, а страница ждет ее решения, перерисовываясь
+                            should_end = session.end_detector.local_decision(
+                                session.conversation_history
+                            )
+                            if should_end is None:
+                                st.session_state.pending_end_check = background_executor.submit(
+                                    session.end_detector.llm_decision,
+                                    session.conversation_history
+                                )
+                                should_end = False
+                            
+                            if should_end:
+                                start_report_job(session)
                             
                             st.session_state.message_key += 1
                             st.rerun()
                 
                 with col_btn2:
                     if st.button("🏁 Завершить диалог", use_container_width=True):
-                        st.session_state.dialogue_ended = True
-                        with st.spinner("Анализирую результаты..."):
-                            st.session_state.report_data = st.session_state.report_generator.generate_report(
-                                st.session_state.conversation_history
-                            )
+                        start_report_job(session)
                         st.session_state.message_key += 1
                         st.rerun()
             else:
                 st.success("✅ Диалог завершен! Сгенерируйте отчет для анализа результатов.")
+                
+                # Показываем части отчета по мере их готовности
+                report_job = get_report_jobs().get(st.session_state.report_job_id) if st.session_state.report_job_id else None
+                if report_job is None and session.report_data is None:
+                    # Генерация отчета прервалась вместе с прошлым запуском сервера - запускаем заново
+                    start_report_job(session)
+                    st.rerun()
+                if report_job is not None:
+                    if report_job.done and not report_job.errors:
+                        session.save_report(session.report_generator.assemble_report(
+                            [report_job.sections[part] for part in report_job.parts]
+                        ))
+                        get_report_jobs().discard(report_job.id)
+                        st.session_state.report_job_id = None
+                    else:
+                        if not report_job.done:
+                            st.progress(report_job.progress, text="Анализирую результаты...")
+                        for section in report_job.sections.values():
+                            render_report_sections(section)
+                        # Отчет не сохраняется, пока все части не готовы: неудавшуюся часть можно перезапустить
+                        for part, error in report_job.errors.items():
+                            st.error(f"Не удалось подготовить часть отчета «{REPORT_PART_TITLES[part]}»: {error}")
+                            if st.button(f"🔄 Повторить: {REPORT_PART_TITLES[part]}", key=f"retry_{part}"):
+                                get_report_jobs().retry(
+                                    report_job.id, session.report_generator, session.conversation_history, part
+                                )
+                                st.rerun()
     
     with col2:
         st.subheader("📊 Статистика")
         
-        if st.session_state.conversation_history:
-            manager_messages = len([msg for msg in st.session_state.conversation_history if msg['role'] == 'manager'])
-            client_messages = len([msg for msg in st.session_state.conversation_history if msg['role'] == 'client'])
+        if session.conversation_history:
+            manager_messages = len([msg for msg in session.conversation_history if msg['role'] == 'manager'])
+            client_messages = len([msg for msg in session.conversation_history if msg['role'] == 'client'])
             
             st.metric("Сообщений менеджера", manager_messages)
             st.metric("Сообщений клиента", client_messages)
-            st.metric("Всего сообщений", len(st.session_state.conversation_history))
+            st.metric("Всего сообщений", len(session.conversation_history))
+        
+        if session.end_detector and session.end_detector.checks:
+            st.metric("Проверок завершения без LLM", f"{session.end_detector.skip_rate:.0%}")
         
-        if st.session_state.dialogue_ended and st.session_state.report_data:
+        if session.dialogue_ended and session.report_data:
             st.subheader("📈 Быстрый анализ")
             
-            rating = st.session_state.report_data.get('overall_rating', 'N/A')
+            rating = session.report_data.get('overall_rating', 'N/A')
             st.metric("Общая оценка", f"{rating}/10")
             
-            strengths_count = len(st.session_state.report_data.get('strengths', []))
-            weaknesses_count = len(st.session_state.report_data.get('weaknesses', []))
+            strengths_count = len(session.report_data.get('strengths', []))
+            weaknesses_count = len(session.report_data.get('weaknesses', []))
             
             st.metric("Сильные стороны", strengths_count)
             st.metric("Области роста", weaknesses_count)
             
-            # Кнопка для генерации отчета
-            if st.button("📄 Скачать отчет", use_container_width=True):
-                docx_bytes = create_docx_report(
-                    st.session_state.report_data,
-                    st.session_state.situation,
-                    st.session_state.conversation_history
-                )
-                
+            # Файл отчета рендерится только по нажатию кнопки, а не при каждой перерисовке
+            # страницы; повторная подготовка того же формата берется из кэша
+            report_format = st.selectbox(
+                "Формат отчета", list(FORMATS), format_func=str.upper, key="report_format"
+            )
+            prepared = st.session_state.get("report_file")
+            if prepared is None or prepared[0] != (session_id, report_format):
+                if st.button("📄 Подготовить отчет", use_container_width=True):
+                    reports_config = CONFIG.get("reports", {})
+                    try:
+                        report_bytes = get_render_cache().get_or_render(
+                            session_id,
+                            report_format,
+                            session.report_data,
+                            session.situation,
+                            session.conversation_history,
+                            template=reports_config.get("docx_template"),
+                            font_path=reports_config.get("pdf_font")
+                        )
+                    except Exception as e:
+                        # Ошибка одного формата не ломает страницу: остальные форматы доступны
+                        st.error(f"Не удалось подготовить отчет в формате {report_format.upper()}: {e}")
+                    else:
+                        st.session_state.report_file = ((session_id, report_format), report_bytes)
+                        st.rerun()
+            else:
+                extension, mime = FORMATS[report_format]
                 st.download_button(
-                    label="💾 Скачать DOCX отчет",
-                    data=docx_bytes,
-                    file_name=f"отчет_переговоры_{datetime.now().strftime('%Y%m%d_%H%M%S')}.docx",
-                    mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+                    label="📄 Скачать отчет",
+                    data=prepared[1],
+                    file_name=f"отчет_переговоры_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{extension}",
+                    mime=mime,
                     use_container_width=True
                 )
+    
+    # Пока отчет готовится или идет фоновая проверка завершения, периодически перерисовываем страницу
+    report_job = get_report_jobs().get(st.session_state.report_job_id) if st.session_state.report_job_id else None
+    if (report_job is not None and not report_job.done) or st.session_state.pending_end_check:
+        time.sleep(1)
+        st.rerun()
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
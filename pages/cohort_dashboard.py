@@ -0,0 +1,90 @@
+from datetime import date, datetime, timedelta
+from typing import Optional
+
+import pandas as pd
+import streamlit as st
+
+from config import CONFIG
+from cohort_analytics import CohortAnalytics
+
+# Результаты запросов кэшируются, чтобы перерисовка страницы не пересчитывала агрегаты
+QUERY_TTL = CONFIG.get("analytics", {}).get("query_ttl_seconds", 300)
+
+PERIODS = {
+    "7 дней": 7,
+    "30 дней": 30,
+    "90 дней": 90,
+    "Все время": None
+}
+
+@st.cache_resource
+def get_cohort_analytics() -> CohortAnalytics:
+    return CohortAnalytics(CONFIG.get("analytics", {}).get("path", "analytics.db"))
+
+@st.cache_data(ttl=QUERY_TTL, show_spinner=False)
+def run_query(name: str, trainee: Optional[str], since: Optional[float], **params) -> pd.DataFrame:
+    """Агрегат CohortAnalytics по имени метода с кэшированием результата"""
+    analytics = get_cohort_analytics()
+    if name == "trainee_ratings":
+        return analytics.trainee_ratings(since=since)
+    return getattr(analytics, name)(trainee=trainee, since=since, **params)
+
+@st.cache_data(ttl=QUERY_TTL, show_spinner=False)
+def load_summary(trainee: Optional[str], since: Optional[float]):
+    return get_cohort_analytics().summary(trainee, since)
+
+@st.cache_data(ttl=QUERY_TTL, show_spinner=False)
+def load_trainees():
+    return get_cohort_analytics().trainees()
+
+def period_start(days: Optional[int]) -> Optional[float]:
+    """Начало периода, округленное до суток, чтобы ключ кэша не менялся при каждой перерисовке.
+
+    Сутки отсчитываются по местному времени, как и день отчета в CohortAnalytics.
+    """
+    if days is None:
+        return None
+    return datetime.combine(date.today() - timedelta(days=days), datetime.min.time()).timestamp()
+
+st.set_page_config(page_title="Аналитика группы", page_icon="📊", layout="wide")
+st.title("📊 Аналитика группы")
+
+col_period, col_trainee = st.columns(2)
+with col_period:
+    since = period_start(PERIODS[st.selectbox("Период", list(PERIODS), index=1)])
+with col_trainee:
+    selected = st.selectbox("Участник", ["Все участники"] + load_trainees())
+trainee = None if selected == "Все участники" else selected
+
+summary = load_summary(trainee, since)
+col1, col2, col3 = st.columns(3)
+col1.metric("Тренировок", summary["sessions"])
+col2.metric("Участников", summary["trainees"])
+col3.metric("Средняя оценка", f"{summary['avg_rating']:.1f}" if pd.notna(summary["avg_rating"]) else "—")
+
+if not summary["sessions"]:
+    st.info("За выбранный период отчетов нет")
+    st.stop()
+
+st.subheader("Оценки по дням")
+over_time = run_query("ratings_over_time", trainee, since)
+st.line_chart(over_time.set_index("day")["avg_rating"])
+
+col_left, col_right = st.columns(2)
+with col_left:
+    st.subheader("Распределение оценок")
+    distribution = run_query("rating_distribution", trainee, since)
+    st.bar_chart(distribution.groupby("rating")["sessions"].sum())
+with col_right:
+    st.subheader("Оценки участников")
+    st.dataframe(run_query("trainee_ratings", None, since), use_container_width=True, hide_index=True)
+
+col_left, col_right = st.columns(2)
+with col_left:
+    st.subheader("Частые слабые стороны")
+    st.dataframe(run_query("top_items", trainee, since, kind="weaknesses", limit=15),
+                 use_container_width=True, hide_index=True)
+with col_right:
+    st.subheader("Техники, которые применяют вместе")
+    st.dataframe(run_query("technique_cooccurrence", trainee, since, limit=15),
+                 use_container_width=True, hide_index=True)
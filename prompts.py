@@ -0,0 +1,124 @@
+"""Версионированный реестр промптов агентов.
+
+Промпты хранятся в каталоге prompts/: по YAML-файлу на версию. Версия может
+наследовать другую (extends) и переопределять только часть промптов, поэтому
+правка промпта оформляется новой версией и сравнивается со старой через replay.py
+до того, как ее включат в config.yaml (prompts.version).
+"""
+import hashlib
+import json
+import os
+import string
+import threading
+from functools import lru_cache
+from typing import Any, Dict, List, Optional
+
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage
+
+from config import CONFIG
+
+PROMPTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "prompts")
+DEFAULT_VERSION = "v1"
+
+# Промпты агентов и подстановки, которые агент передает в каждый из них
+PROMPT_VARIABLES = {
+    ("situation", "system"): set(),
+    ("situation", "group"): {"stakeholders"},
+    ("situation", "user"): {"fields_json"},
+    ("summarizer", "system"): set(),
+    ("summarizer", "user"): {"previous_summary", "history_text"},
+    ("client", "system"): {"client_role", "situation", "client_concerns"},
+    ("client", "user"): {"history_text"},
+    ("stakeholder", "system"): {"role", "situation", "concerns", "colleagues"},
+    ("stakeholder", "user"): {"history_text", "colleagues_text"},
+    ("end_check", "system"): {"manager_goal"},
+    ("end_check", "user"): {"history_text"},
+    ("report", "system"): {"situation", "manager_goal", "product"},
+    ("report", "user"): {"manager_text", "fields_json"},
+    ("repair", "user"): {"missing", "fields_json"}
+}
+
+class PromptSet:
+    """Промпты всех агентов одной версии"""
+
+    def __init__(self, version: str, templates: Dict[str, Dict[str, str]]):
+        self.version = version
+        self.templates = templates
+        payload = json.dumps(templates, ensure_ascii=False, sort_keys=True)
+        # Хэш содержимого отличает версии с одинаковым именем, но разным текстом
+        self.fingerprint = hashlib.sha256(payload.encode("utf-8")).hexdigest()[:12]
+
+    def render(self, agent: str, part: str, **values: Any) -> str:
+        return self.templates[agent][part].format(**values)
+
+    def messages(self, agent: str, system_extra: str = "", **values: Any) -> List[BaseMessage]:
+        """Системное и пользовательское сообщения агента"""
+        return [
+            SystemMessage(content=self.render(agent, "system", **values) + system_extra),
+            HumanMessage(content=self.render(agent, "user", **values))
+        ]
+
+def check_templates(version: str, templates: Dict[str, Dict[str, str]]) -> None:
+    """Проверяет, что заданы все промпты и в них нет неизвестных подстановок"""
+    problems = []
+    for (agent, part), allowed in PROMPT_VARIABLES.items():
+        template = templates.get(agent, {}).get(part)
+        if not isinstance(template, str):
+            problems.append(f"нет промпта {agent}.{part}")
+            continue
+        try:
+            used = {name for _, name, _, _ in string.Formatter().parse(template) if name is not None}
+        except ValueError as exc:
+            problems.append(f"{agent}.{part}: {exc}")
+            continue
+        unknown = used - allowed
+        if unknown:
+            problems.append(f"{agent}.{part}: неизвестные подстановки {', '.join(sorted(unknown))}")
+    if problems:
+        raise ValueError(f"Промпты версии {version}: " + "; ".join(problems))
+
+class PromptRegistry:
+    """Версии промптов из каталога: файл <версия>.yaml на версию"""
+
+    def __init__(self, directory: str = PROMPTS_DIR):
+        self.directory = directory
+        self._sets: Dict[str, PromptSet] = {}
+        self._lock = threading.Lock()
+
+    def versions(self) -> List[str]:
+        return sorted(name[:-len(".yaml")] for name in os.listdir(self.directory) if name.endswith(".yaml"))
+
+    def _read(self, version: str) -> Dict[str, Any]:
+        import yaml
+
+        path = os.path.join(self.directory, f"{version}.yaml")
+        if not os.path.exists(path):
+            raise ValueError(f"Неизвестная версия промптов: {version}")
+        with open(path, encoding="utf-8") as f:
+            return yaml.safe_load(f) or {}
+
+    def _templates(self, version: str, seen: tuple = ()) -> Dict[str, Dict[str, str]]:
+        if version in seen:
+            raise ValueError(f"Циклическое наследование версий промптов: {' -> '.join(seen + (version,))}")
+        data = self._read(version)
+        base = data.pop("extends", None)
+        templates = self._templates(base, seen + (version,)) if base else {}
+        for agent, parts in data.items():
+            templates[agent] = dict(templates.get(agent, {}), **(parts or {}))
+        return templates
+
+    def get(self, version: str) -> PromptSet:
+        with self._lock:
+            if version not in self._sets:
+                templates = self._templates(version)
+                check_templates(version, templates)
+                self._sets[version] = PromptSet(version, templates)
+            return self._sets[version]
+
+@lru_cache(maxsize=1)
+def get_registry() -> PromptRegistry:
+    return PromptRegistry(CONFIG.get("prompts", {}).get("directory") or PROMPTS_DIR)
+
+def get_prompts(version: Optional[str] = None) -> PromptSet:
+    """Промпты заданной версии; без версии - версия из конфигурации"""
+    return get_registry().get(version or CONFIG.get("prompts", {}).get("version", DEFAULT_VERSION))
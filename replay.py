@@ -0,0 +1,257 @@
+"""Повторный прогон сохраненных диалогов под двумя версиями промптов или моделей.
+
+Пример:
+    python session_store.py sessions.db transcripts.jsonl
+    python replay.py transcripts.jsonl --base v1 --candidate v2 --output replay.json --markdown replay.md
+    python replay.py transcripts.jsonl --candidate-model GigaChat-2-Pro --llm gigachat
+
+Каждый диалог прогоняется через DialogueEndDetector и ReportGenerator в базовом и
+проверяемом вариантах параллельно. Сравниваются решения о завершении диалога,
+оценка из отчета, расход токенов и задержки этапов. Код возврата ненулевой, если
+токены или медианная задержка этапа у проверяемого варианта выросли больше порога.
+"""
+import argparse
+import json
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+from agents import DialogueEndDetector, ReportGenerator
+from batch_eval import load_llm, percentile, read_transcripts
+from cohort_analytics import parse_rating
+from prompts import PromptSet, get_prompts
+from simulator import RecordingLLM, StageStats
+
+# Этапы, которые прогоняются повторно
+STAGES = ("end_check", "report")
+
+class ReplayVariant:
+    """Версия промптов и модели, под которой прогоняются диалоги"""
+
+    def __init__(self, name: str, prompts: PromptSet, llm_spec: str = "gigachat", model: Optional[str] = None):
+        self.name = name
+        self.prompts = prompts
+        self.model = model
+        self.stats = StageStats()
+        self.llms = {
+            stage: RecordingLLM(load_llm(llm_spec, f"replay-{name}", stage, model), stage, self.stats)
+            for stage in STAGES
+        }
+
+    def describe(self) -> Dict[str, Any]:
+        return {"prompts": self.prompts.version, "fingerprint": self.prompts.fingerprint, "model": self.model}
+
+def end_checkpoints(conversation_history: List[Dict[str, str]], max_checks: int) -> List[int]:
+    """Длины истории, после которых приложение проверяет завершение: после ответов клиента"""
+    points = [
+        i + 1 for i, msg in enumerate(conversation_history)
+        if msg['role'] == 'client' and i + 1 >= 4
+    ]
+    return points[-max_checks:] if max_checks else points
+
+def replay_transcript(variant: ReplayVariant, record: Dict[str, Any], max_end_checks: int = 3) -> Dict[str, Any]:
+    """Решения о завершении в контрольных точках диалога и отчет по нему"""
+    started = time.perf_counter()
+    result: Dict[str, Any] = {"id": record["id"]}
+    history = record["conversation_history"]
+    try:
+        # Проверяется именно промпт модели, поэтому локальная стадия детектора пропускается
+        detector = DialogueEndDetector(variant.llms["end_check"], record["situation"], prompts=variant.prompts)
+        result["end_decisions"] = {
+            length: detector.llm_decision(history[:length])
+            for length in end_checkpoints(history, max_end_checks)
+        }
+        generator = ReportGenerator(variant.llms["report"], record["situation"], prompts=variant.prompts)
+        result["rating"] = parse_rating(generator.generate_report(history).get("overall_rating"))
+    except Exception as exc:
+        result["error"] = str(exc)
+    result["latency"] = round(time.perf_counter() - started, 3)
+    return result
+
+def stage_summary(stats: StageStats, stage: str) -> Dict[str, Any]:
+    latencies = stats.latencies.get(stage, [])
+    calls = len(latencies)
+    tokens = stats.tokens[stage]
+    return {
+        "calls": calls,
+        "tokens_per_call": round((tokens["prompt"] + tokens["completion"]) / calls, 1) if calls else 0.0,
+        "prompt_tokens": tokens["prompt"],
+        "completion_tokens": tokens["completion"],
+        "latency_p50": round(percentile(latencies, 50), 3),
+        "latency_p95": round(percentile(latencies, 95), 3)
+    }
+
+def ratio(before: float, after: float) -> float:
+    return round(after / before, 3) if before else 1.0
+
+def compare_runs(base: ReplayVariant, candidate: ReplayVariant, base_results: List[Dict[str, Any]],
+                 candidate_results: List[Dict[str, Any]], max_token_ratio: float = 1.5,
+                 max_latency_ratio: float = 1.5) -> Dict[str, Any]:
+    """Сравнение двух прогонов: согласие решений о завершении, дрейф оценки, токены и задержки"""
+    candidate_by_id = {result["id"]: result for result in candidate_results}
+    rows, disagreements, drifts = [], [], []
+    checks = agreed = errors = 0
+    for before in base_results:
+        after = candidate_by_id.get(before["id"], {"error": "нет результата"})
+        row: Dict[str, Any] = {"id": before["id"]}
+        if "error" in before or "error" in after:
+            errors += 1
+            row["error"] = before.get("error") or after.get("error")
+            rows.append(row)
+            continue
+        for length, decision in before["end_decisions"].items():
+            checks += 1
+            if after["end_decisions"].get(length) == decision:
+                agreed += 1
+            else:
+                disagreements.append({
+                    "id": before["id"], "messages": length,
+                    "base": decision, "candidate": after["end_decisions"].get(length)
+                })
+        row["base_rating"] = before["rating"]
+        row["candidate_rating"] = after["rating"]
+        if before["rating"] is not None and after["rating"] is not None:
+            row["rating_drift"] = round(after["rating"] - before["rating"], 2)
+            drifts.append(row["rating_drift"])
+        rows.append(row)
+
+    stages = {}
+    for stage in STAGES:
+        before = stage_summary(base.stats, stage)
+        after = stage_summary(candidate.stats, stage)
+        token_ratio = ratio(before["tokens_per_call"], after["tokens_per_call"])
+        latency_ratio = ratio(before["latency_p50"], after["latency_p50"])
+        stages[stage] = {
+            "base": before,
+            "candidate": after,
+            "token_ratio": token_ratio,
+            "latency_ratio": latency_ratio,
+            "regression": token_ratio > max_token_ratio or latency_ratio > max_latency_ratio
+        }
+
+    return {
+        "base": base.describe(),
+        "candidate": candidate.describe(),
+        "transcripts": len(base_results),
+        "errors": errors,
+        "end_checks": checks,
+        "end_agreement": round(agreed / checks, 3) if checks else 1.0,
+        "end_disagreements": disagreements,
+        "rating": {
+            "compared": len(drifts),
+            "mean_drift": round(sum(drifts) / len(drifts), 2) if drifts else 0.0,
+            "mean_abs_drift": round(sum(abs(d) for d in drifts) / len(drifts), 2) if drifts else 0.0,
+            "max_abs_drift": max((abs(d) for d in drifts), default=0.0),
+            "changed": sum(abs(d) >= 1 for d in drifts)
+        },
+        "stages": stages,
+        "thresholds": {"max_token_ratio": max_token_ratio, "max_latency_ratio": max_latency_ratio},
+        "regression": any(stage["regression"] for stage in stages.values()),
+        "rows": rows
+    }
+
+def run_replay(records: List[Dict[str, Any]], base: ReplayVariant, candidate: ReplayVariant, workers: int = 4,
+               max_end_checks: int = 3, max_token_ratio: float = 1.5,
+               max_latency_ratio: float = 1.5) -> Dict[str, Any]:
+    """Прогоняет диалоги под обоими вариантами одновременно и сравнивает результаты"""
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        # Задачи вариантов чередуются, чтобы оба шли под одинаковой нагрузкой на модель
+        futures = [
+            (pool.submit(replay_transcript, base, record, max_end_checks),
+             pool.submit(replay_transcript, candidate, record, max_end_checks))
+            for record in records
+        ]
+        base_results = [before.result() for before, _ in futures]
+        candidate_results = [after.result() for _, after in futures]
+    diff = compare_runs(base, candidate, base_results, candidate_results, max_token_ratio, max_latency_ratio)
+    diff["elapsed_seconds"] = round(time.perf_counter() - started, 2)
+    return diff
+
+def render_markdown(diff: Dict[str, Any]) -> str:
+    """Отчет о сравнении для ревью правки промпта"""
+    base, candidate = diff["base"], diff["candidate"]
+    lines = [
+        "# Сравнение версий промптов",
+        "",
+        f"- Базовый вариант: {base['prompts']} ({base['fingerprint']}), модель: {base['model'] or 'по маршруту'}",
+        f"- Проверяемый вариант: {candidate['prompts']} ({candidate['fingerprint']}), "
+        f"модель: {candidate['model'] or 'по маршруту'}",
+        f"- Диалогов: {diff['transcripts']}, с ошибками: {diff['errors']}",
+        f"- Итог: {'РЕГРЕССИЯ' if diff['regression'] else 'без регрессий'}",
+        "",
+        "## Решения о завершении",
+        "",
+        f"Совпадение решений: {diff['end_agreement']:.0%} из {diff['end_checks']} проверок.",
+        ""
+    ]
+    if diff["end_disagreements"]:
+        lines += ["| Диалог | Сообщений | Базовый | Проверяемый |", "|---|---|---|---|"]
+        lines += [
+            f"| {row['id']} | {row['messages']} | {'ДА' if row['base'] else 'НЕТ'} | "
+            f"{'ДА' if row['candidate'] else 'НЕТ'} |"
+            for row in diff["end_disagreements"]
+        ]
+        lines.append("")
+    rating = diff["rating"]
+    lines += [
+        "## Оценка",
+        "",
+        f"Сравнено отчетов: {rating['compared']}, средний сдвиг: {rating['mean_drift']:+.2f}, "
+        f"средний модуль сдвига: {rating['mean_abs_drift']:.2f}, максимальный: {rating['max_abs_drift']:.2f}, "
+        f"изменилось на балл и больше: {rating['changed']}.",
+        "",
+        "## Токены и задержки",
+        "",
+        "| Этап | Токенов на вызов | Задержка p50, с | Задержка p95, с | Токены | Задержка | |",
+        "|---|---|---|---|---|---|---|"
+    ]
+    for stage, row in diff["stages"].items():
+        before, after = row["base"], row["candidate"]
+        lines.append(
+            f"| {stage} | {before['tokens_per_call']} -> {after['tokens_per_call']} | "
+            f"{before['latency_p50']} -> {after['latency_p50']} | {before['latency_p95']} -> {after['latency_p95']} | "
+            f"x{row['token_ratio']} | x{row['latency_ratio']} | {'РЕГРЕССИЯ' if row['regression'] else ''} |"
+        )
+    return "\n".join(lines) + "\n"
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Сравнение версий промптов и моделей на сохраненных диалогах")
+    parser.add_argument("input", help="JSONL с диалогами (выгрузка session_store.py)")
+    parser.add_argument("--base", help="базовая версия промптов (по умолчанию из конфигурации)")
+    parser.add_argument("--candidate", help="проверяемая версия промптов (по умолчанию из конфигурации)")
+    parser.add_argument("--base-model", help="модель базового варианта вместо модели из маршрута")
+    parser.add_argument("--candidate-model", help="модель проверяемого варианта вместо модели из маршрута")
+    parser.add_argument("--llm", default="gigachat", help='"gigachat" или "module:factory"')
+    parser.add_argument("--workers", type=int, default=4, help="число параллельных прогонов")
+    parser.add_argument("--limit", type=int, help="прогнать не больше N диалогов")
+    parser.add_argument("--end-checks", type=int, default=3,
+                        help="сколько последних контрольных точек диалога проверять на завершение (0 - все)")
+    parser.add_argument("--max-token-ratio", type=float, default=1.5, help="допустимый рост токенов на вызов")
+    parser.add_argument("--max-latency-ratio", type=float, default=1.5, help="допустимый рост медианной задержки")
+    parser.add_argument("--output", help="сохранить сравнение в JSON")
+    parser.add_argument("--markdown", help="сохранить отчет о сравнении в Markdown")
+    args = parser.parse_args(argv)
+
+    records = [
+        record for record in read_transcripts(args.input)
+        if record.get("situation") and record.get("conversation_history")
+    ][:args.limit]
+    base = ReplayVariant("base", get_prompts(args.base), args.llm, args.base_model)
+    candidate = ReplayVariant("candidate", get_prompts(args.candidate), args.llm, args.candidate_model)
+    diff = run_replay(records, base, candidate, args.workers, args.end_checks,
+                      args.max_token_ratio, args.max_latency_ratio)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(diff, f, ensure_ascii=False, indent=2)
+    markdown = render_markdown(diff)
+    if args.markdown:
+        with open(args.markdown, "w", encoding="utf-8") as f:
+            f.write(markdown)
+    sys.stdout.write(markdown)
+    return 1 if diff["regression"] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,275 @@
+"""Выгрузка отчетов по тренировкам в DOCX, PDF, Markdown и HTML.
+
+Все форматы строятся из одной промежуточной модели документа (список блоков),
+DOCX заполняет заранее оформленный шаблон, который читается с диска один раз.
+
+Выгрузка отчетов всех сохраненных тренировок в ZIP:
+    python report_export.py sessions.db reports.zip --format docx --workers 4
+"""
+import argparse
+import hashlib
+import html
+import io
+import json
+import threading
+import zipfile
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from conversation import message_label
+
+# Разделы отчета: поле отчета и заголовок раздела
+REPORT_SECTIONS = [
+    ("strengths", "Сильные стороны"),
+    ("weaknesses", "Области для улучшения"),
+    ("recommendations", "Рекомендации"),
+    ("growth_areas", "Области для развития"),
+    ("techniques_used", "Использованные техники"),
+    ("missed_opportunities", "Упущенные возможности")
+]
+
+# Форматы выгрузки: расширение файла и MIME-тип
+FORMATS = {
+    "docx": ("docx", "application/vnd.openxmlformats-officedocument.wordprocessingml.document"),
+    "pdf": ("pdf", "application/pdf"),
+    "md": ("md", "text/markdown"),
+    "html": ("html", "text/html")
+}
+
+# Блок документа: (вид, содержимое). Виды: title, heading, paragraph, bullets, numbered
+Block = Tuple[str, Any]
+
+def build_report_document(report_data: Dict[str, Any], situation: Dict[str, str],
+                          conversation_history: Iterable[Dict[str, str]],
+                          created: Optional[datetime] = None) -> List[Block]:
+    """Промежуточная модель отчета, общая для всех форматов"""
+    created = created or datetime.now()
+    blocks: List[Block] = [
+        ("title", "Отчет по тренировке переговоров"),
+        ("heading", "Информация о сессии"),
+        ("paragraph", f"Дата: {created.strftime('%d.%m.%Y %H:%M')}"),
+        ("paragraph", f"Ситуация: {situation['situation']}"),
+        ("paragraph", f"Продукт: {situation['product']}"),
+        ("paragraph", f"Цель: {situation['manager_goal']}")
+    ]
+    if situation.get('stakeholders'):
+        blocks.append(("paragraph", "Участники со стороны клиента:"))
+        blocks.append(("bullets", [
+            f"{stakeholder['role']}: {stakeholder.get('concerns', '')}" for stakeholder in situation['stakeholders']
+        ]))
+    blocks.append(("heading", "Резюме переговоров"))
+    blocks.append(("paragraph", report_data.get('summary', 'Резюме не доступно')))
+    for field, heading in REPORT_SECTIONS:
+        blocks.append(("heading", heading))
+        blocks.append(("bullets", list(report_data.get(field, []))))
+    blocks.append(("heading", "Общая оценка"))
+    blocks.append(("paragraph", f"Оценка: {report_data.get('overall_rating', 'Не оценено')}/10"))
+    blocks.append(("heading", "История диалога"))
+    blocks.append(("numbered", [
+        f"{message_label(msg) or 'Клиент'}: {msg['content']}" for msg in conversation_history
+    ]))
+    return blocks
+
+def report_hash(report_data: Dict[str, Any], situation: Dict[str, str],
+                conversation_history: Iterable[Dict[str, str]]) -> str:
+    """Хэш содержимого отчета для кэша выгрузок"""
+    payload = json.dumps(
+        [report_data, situation, list(conversation_history)], ensure_ascii=False, sort_keys=True
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+@lru_cache(maxsize=4)
+def load_template(path: Optional[str] = None) -> bytes:
+    """Шаблон DOCX, прочитанный один раз; без пути - стандартный шаблон python-docx"""
+    if path:
+        with open(path, "rb") as f:
+            return f.read()
+    from docx import Document
+    buffer = io.BytesIO()
+    Document().save(buffer)
+    return buffer.getvalue()
+
+def render_docx(blocks: List[Block], template: Optional[str] = None) -> bytes:
+    """DOCX по шаблону: содержимое дописывается после того, что уже есть в шаблоне"""
+    from docx import Document
+    from docx.enum.text import WD_ALIGN_PARAGRAPH
+
+    doc = Document(io.BytesIO(load_template(template)))
+    # Стили ищутся один раз на документ, а не для каждого пункта списка
+    bullet_style = doc.styles['List Bullet']
+    for kind, content in blocks:
+        if kind == "title":
+            doc.add_heading(content, 0).alignment = WD_ALIGN_PARAGRAPH.CENTER
+        elif kind == "heading":
+            doc.add_heading(content, level=1)
+        elif kind == "paragraph":
+            doc.add_paragraph(content)
+        elif kind == "bullets":
+            for item in content:
+                doc.add_paragraph(item, style=bullet_style)
+        elif kind == "numbered":
+            for i, item in enumerate(content, 1):
+                doc.add_paragraph(f"{i}. {item}")
+    buffer = io.BytesIO()
+    doc.save(buffer)
+    return buffer.getvalue()
+
+def render_markdown(blocks: List[Block]) -> bytes:
+    lines = []
+    for kind, content in blocks:
+        if kind == "title":
+            lines += [f"# {content}", ""]
+        elif kind == "heading":
+            lines += [f"## {content}", ""]
+        elif kind == "paragraph":
+            lines += [content, ""]
+        elif kind == "bullets":
+            lines += [f"- {item}" for item in content] + [""]
+        elif kind == "numbered":
+            lines += [f"{i}. {item}" for i, item in enumerate(content, 1)] + [""]
+    return "\n".join(lines).encode("utf-8")
+
+def render_html(blocks: List[Block]) -> bytes:
+    parts = []
+    for kind, content in blocks:
+        if kind == "title":
+            parts.append(f"<h1>{html.escape(content)}</h1>")
+        elif kind == "heading":
+            parts.append(f"<h2>{html.escape(content)}</h2>")
+        elif kind == "paragraph":
+            parts.append(f"<p>{html.escape(content)}</p>")
+        elif kind in ("bullets", "numbered"):
+            tag = "ul" if kind == "bullets" else "ol"
+            items = "".join(f"<li>{html.escape(item)}</li>" for item in content)
+            parts.append(f"<{tag}>{items}</{tag}>")
+    title = html.escape(next((content for kind, content in blocks if kind == "title"), "Отчет"))
+    page = (
+        f'<!DOCTYPE html>\n<html lang="ru"><head><meta charset="utf-8"><title>{title}</title></head>'
+        f"<body>\n" + "\n".join(parts) + "\n</body></html>\n"
+    )
+    return page.encode("utf-8")
+
+def render_pdf(blocks: List[Block], font_path: Optional[str] = None) -> bytes:
+    """PDF через reportlab; для кириллицы нужен TTF-шрифт (reports.pdf_font)"""
+    try:
+        from reportlab.lib.styles import getSampleStyleSheet
+        from reportlab.pdfbase import pdfmetrics
+        from reportlab.pdfbase.ttfonts import TTFont
+        from reportlab.platypus import ListFlowable, Paragraph, SimpleDocTemplate
+    except ImportError as exc:
+        raise RuntimeError("Для выгрузки в PDF установите пакет reportlab") from exc
+
+    styles = getSampleStyleSheet()
+    if font_path:
+        if "ReportFont" not in pdfmetrics.getRegisteredFontNames():
+            try:
+                pdfmetrics.registerFont(TTFont("ReportFont", font_path))
+            except Exception as exc:
+                # reportlab сообщает о недоступном шрифте своим TTFError
+                raise RuntimeError(f"Не удалось загрузить шрифт для PDF (reports.pdf_font): {font_path}") from exc
+        for style in styles.byName.values():
+            style.fontName = "ReportFont"
+    story = []
+    for kind, content in blocks:
+        if kind == "title":
+            story.append(Paragraph(html.escape(content), styles["Title"]))
+        elif kind == "heading":
+            story.append(Paragraph(html.escape(content), styles["Heading2"]))
+        elif kind == "paragraph":
+            story.append(Paragraph(html.escape(content), styles["BodyText"]))
+        elif kind in ("bullets", "numbered") and content:
+            story.append(ListFlowable(
+                [Paragraph(html.escape(item), styles["BodyText"]) for item in content],
+                bulletType="bullet" if kind == "bullets" else "1",
+                bulletFontName=styles["BodyText"].fontName
+            ))
+    buffer = io.BytesIO()
+    SimpleDocTemplate(buffer).build(story)
+    return buffer.getvalue()
+
+def render_report(blocks: List[Block], fmt: str = "docx", template: Optional[str] = None,
+                  font_path: Optional[str] = None) -> bytes:
+    """Отчет в заданном формате из FORMATS"""
+    if fmt == "docx":
+        return render_docx(blocks, template)
+    if fmt == "pdf":
+        return render_pdf(blocks, font_path)
+    if fmt == "md":
+        return render_markdown(blocks)
+    if fmt == "html":
+        return render_html(blocks)
+    raise ValueError(f"Неизвестный формат отчета: {fmt}")
+
+class RenderCache:
+    """Кэш готовых файлов отчетов по (сессия, формат, хэш отчета) с вытеснением по LRU"""
+
+    def __init__(self, max_entries: int = 200):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[str, str, str], bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_render(self, session_id: str, fmt: str, report_data: Dict[str, Any],
+                      situation: Dict[str, str], conversation_history: Iterable[Dict[str, str]],
+                      template: Optional[str] = None, font_path: Optional[str] = None) -> bytes:
+        conversation_history = list(conversation_history)
+        key = (session_id, fmt, report_hash(report_data, situation, conversation_history))
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key]
+        blocks = build_report_document(report_data, situation, conversation_history)
+        data = render_report(blocks, fmt, template, font_path)
+        with self._lock:
+            self._entries[key] = data
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return data
+
+def _render_item(item: Dict[str, Any], fmt: str, template: Optional[str],
+                 font_path: Optional[str]) -> Tuple[str, bytes]:
+    created = datetime.fromtimestamp(item["updated"]) if item.get("updated") else None
+    blocks = build_report_document(item["report"], item["situation"], item["messages"], created)
+    return f"{item['id']}.{FORMATS[fmt][0]}", render_report(blocks, fmt, template, font_path)
+
+def render_bulk_zip(items: Iterable[Dict[str, Any]], fmt: str = "docx", template: Optional[str] = None,
+                    font_path: Optional[str] = None, workers: int = 4) -> bytes:
+    """ZIP с отчетами нескольких тренировок, которые рендерятся в пуле процессов.
+
+    Каждый элемент - сессия из SessionStore: id, situation, report, messages.
+    """
+    items = [item for item in items if item.get("report") and item.get("situation")]
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(_render_item, item, fmt, template, font_path) for item in items]
+            for future in futures:
+                name, data = future.result()
+                archive.writestr(name, data)
+    return buffer.getvalue()
+
+def main(argv: Optional[List[str]] = None) -> None:
+    from config import CONFIG
+    from session_store import SQLiteSessionStore
+
+    reports_config = CONFIG.get("reports", {})
+    parser = argparse.ArgumentParser(description="Выгрузка отчетов сохраненных тренировок в ZIP")
+    parser.add_argument("sessions", help="файл хранилища тренировок")
+    parser.add_argument("output", help="ZIP-архив с отчетами")
+    parser.add_argument("--format", choices=list(FORMATS), default="docx")
+    parser.add_argument("--template", default=reports_config.get("docx_template"),
+                        help="шаблон DOCX (по умолчанию reports.docx_template)")
+    parser.add_argument("--font", default=reports_config.get("pdf_font"),
+                        help="TTF-шрифт с кириллицей для PDF (по умолчанию reports.pdf_font)")
+    parser.add_argument("--workers", type=int, default=4, help="число процессов рендеринга")
+    args = parser.parse_args(argv)
+
+    sessions = SQLiteSessionStore(args.sessions).sessions()
+    data = render_bulk_zip(sessions, args.format, args.template, args.font, args.workers)
+    with open(args.output, "wb") as f:
+        f.write(data)
+
+if __name__ == "__main__":
+    main()
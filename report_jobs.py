@@ -0,0 +1,88 @@
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+class ReportJob:
+    """Фоновая генерация отчета, части которого появляются по мере готовности"""
+
+    def __init__(self, parts: List[str]):
+        self.id = uuid.uuid4().hex
+        self.parts = parts
+        self.sections: Dict[str, Dict[str, Any]] = {}
+        self.errors: Dict[str, str] = {}
+        self.started = time.time()
+        self.finished: Optional[float] = None
+
+    @property
+    def done(self) -> bool:
+        return self.finished is not None
+
+    @property
+    def progress(self) -> float:
+        """Доля готовых частей отчета"""
+        return (len(self.sections) + len(self.errors)) / len(self.parts)
+
+class ReportJobManager:
+    """Очередь фоновых задач генерации отчетов, общая для всех сессий.
+
+    Каждая часть отчета выполняется отдельной задачей пула, поэтому части одного
+    отчета генерируются параллельно, а интерфейс может показывать их по мере готовности.
+    """
+
+    def __init__(self, max_workers: int = 4, keep_seconds: int = 3600):
+        self.keep_seconds = keep_seconds
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="report-job")
+        self._jobs: Dict[str, ReportJob] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, report_generator, conversation_history, parts: List[str]) -> str:
+        """Ставит генерацию отчета в очередь и возвращает идентификатор задачи"""
+        job = ReportJob(list(parts))
+        with self._lock:
+            self._forget_stale()
+            self._jobs[job.id] = job
+        for part in job.parts:
+            self._executor.submit(self._run_part, job, report_generator, conversation_history, part)
+        return job.id
+
+    def retry(self, job_id: str, report_generator, conversation_history, part: str) -> bool:
+        """Повторно запускает часть отчета, завершившуюся ошибкой"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or part not in job.errors:
+                return False
+            del job.errors[part]
+            job.finished = None
+        self._executor.submit(self._run_part, job, report_generator, conversation_history, part)
+        return True
+
+    def get(self, job_id: str) -> Optional[ReportJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def discard(self, job_id: str) -> None:
+        with self._lock:
+            self._jobs.pop(job_id, None)
+
+    def _run_part(self, job: ReportJob, report_generator, conversation_history, part: str) -> None:
+        try:
+            section = report_generator.generate_report_part(conversation_history, part)
+        except Exception as exc:
+            section = None
+            error = str(exc)
+        with self._lock:
+            if section is not None:
+                job.sections[part] = section
+            else:
+                job.errors[part] = error
+            if len(job.sections) + len(job.errors) == len(job.parts):
+                job.finished = time.time()
+
+    def _forget_stale(self) -> None:
+        now = time.time()
+        stale = [job_id for job_id, job in self._jobs.items()
+                 if job.done and now - job.finished > self.keep_seconds]
+        for job_id in stale:
+            del self._jobs[job_id]
@@ -0,0 +1,159 @@
+import hashlib
+import json
+import random
+import sqlite3
+import threading
+import time
+from typing import Any, AsyncIterator, Callable, Iterator, List, Optional, Tuple
+
+from langchain_core.messages import AIMessage, AIMessageChunk
+
+from instrumentation import METRICS, answered_by, model_name
+
+# Политики кэширования ответов агентов
+POLICY_NEVER = "never"    # всегда спрашивать модель
+POLICY_EXACT = "exact"    # одинаковый запрос - одинаковый ответ
+POLICY_SAMPLE = "sample"  # копить до samples разных ответов, затем отдавать случайный из них
+
+def llm_temperature(llm) -> Optional[float]:
+    """Температура модели, спрятанной за цепочкой оберток"""
+    while llm is not None:
+        temperature = getattr(llm, "temperature", None)
+        if isinstance(temperature, (int, float)):
+            return float(temperature)
+        llm = getattr(llm, "llm", None)
+    return None
+
+def cache_key(model: str, messages, temperature: Optional[float]) -> str:
+    """Хэш модели, промптов и температуры"""
+    payload = json.dumps({
+        "model": model,
+        "temperature": temperature,
+        "messages": [[message.type, message.content] for message in messages]
+    }, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class ResponseCache:
+    """Персистентный кэш ответов модели в SQLite с вытеснением по LRU и TTL"""
+
+    def __init__(self, path: str = "response_cache.db", max_entries: int = 5000,
+                 ttl_seconds: Optional[float] = None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT, slot INTEGER, response TEXT, created REAL, accessed REAL, "
+                "PRIMARY KEY (key, slot))"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+
+    def get(self, key: str) -> List[str]:
+        """Все непросроченные ответы по ключу"""
+        now = time.time()
+        with self._lock, self._conn:
+            if self.ttl_seconds:
+                self._conn.execute(
+                    "DELETE FROM responses WHERE key = ? AND created < ?", (key, now - self.ttl_seconds)
+                )
+            rows = self._conn.execute(
+                "SELECT response FROM responses WHERE key = ? ORDER BY slot", (key,)
+            ).fetchall()
+            if rows:
+                self._conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+        return [row[0] for row in rows]
+
+    def put(self, key: str, response: str) -> None:
+        """Добавляет ответ по ключу и вытесняет давно не использованные записи"""
+        now = time.time()
+        with self._lock, self._conn:
+            slot = self._conn.execute(
+                "SELECT COALESCE(MAX(slot) + 1, 0) FROM responses WHERE key = ?", (key,)
+            ).fetchone()[0]
+            self._conn.execute(
+                "INSERT INTO responses (key, slot, response, created, accessed) VALUES (?, ?, ?, ?, ?)",
+                (key, slot, response, now, now)
+            )
+            overflow = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0] - self.max_entries
+            if overflow > 0:
+                self._conn.execute(
+                    "DELETE FROM responses WHERE rowid IN "
+                    "(SELECT rowid FROM responses ORDER BY accessed LIMIT ?)", (overflow,)
+                )
+
+class CachedLLM:
+    """Обертка над моделью, отвечающая из кэша согласно политике агента.
+
+    Кэшируются только ответы той модели, под именем которой строится ключ: ответ
+    запасной модели маршрута в кэш не попадает. Пустые ответы и ответы, которые
+    не прошли validator (например, JSON не по схеме агента), тоже не кэшируются,
+    чтобы неудачный ответ не повторялся весь срок жизни записи.
+    """
+
+    def __init__(self, llm, cache: ResponseCache, agent: str, policy: str = POLICY_EXACT, samples: int = 20,
+                 validator: Optional[Callable[[str], bool]] = None):
+        self.llm = llm
+        self.cache = cache
+        self.agent = agent
+        self.policy = policy
+        self.samples = samples
+        self.validator = validator
+        self.model = model_name(llm)
+
+    def _lookup(self, messages) -> Tuple[str, Optional[str]]:
+        key = cache_key(self.model, messages, llm_temperature(self.llm))
+        cached = self.cache.get(key)
+        hit = None
+        if cached and (self.policy == POLICY_EXACT or len(cached) >= self.samples):
+            hit = cached[0] if self.policy == POLICY_EXACT else random.choice(cached)
+        METRICS.record_cache(self.agent, hit is not None)
+        return key, hit
+
+    def _store(self, key: str, content: str, model: str) -> None:
+        if model != self.model or not content.strip():
+            return
+        if self.validator is not None and not self.validator(content):
+            return
+        self.cache.put(key, content)
+
+    def invoke(self, messages, **kwargs: Any):
+        key, hit = self._lookup(messages)
+        if hit is not None:
+            return AIMessage(content=hit)
+        response = self.llm.invoke(messages, **kwargs)
+        self._store(key, response.content, answered_by(response, self.model))
+        return response
+
+    async def ainvoke(self, messages, **kwargs: Any):
+        key, hit = self._lookup(messages)
+        if hit is not None:
+            return AIMessage(content=hit)
+        response = await self.llm.ainvoke(messages, **kwargs)
+        self._store(key, response.content, answered_by(response, self.model))
+        return response
+
+    def stream(self, messages, **kwargs: Any) -> Iterator[Any]:
+        key, hit = self._lookup(messages)
+        if hit is not None:
+            yield AIMessageChunk(content=hit)
+            return
+        parts, model = [], self.model
+        for chunk in self.llm.stream(messages, **kwargs):
+            parts.append(chunk.content)
+            model = answered_by(chunk, model)
+            yield chunk
+        self._store(key, "".join(parts), model)
+
+    async def astream(self, messages, **kwargs: Any) -> AsyncIterator[Any]:
+        key, hit = self._lookup(messages)
+        if hit is not None:
+            yield AIMessageChunk(content=hit)
+            return
+        parts, model = [], self.model
+        async for chunk in self.llm.astream(messages, **kwargs):
+            parts.append(chunk.content)
+            model = answered_by(chunk, model)
+            yield chunk
+        self._store(key, "".join(parts), model)
@@ -0,0 +1,76 @@
+from dataclasses import dataclass, fields
+from typing import Any, Dict, List, Tuple
+
+@dataclass
+class Situation:
+    """Ситуация для тренировки переговоров"""
+    situation: str
+    manager_role: str
+    client_role: str
+    manager_goal: str
+    client_concerns: str
+    product: str
+    context: str
+
+@dataclass
+class GroupSituation(Situation):
+    """Ситуация групповых переговоров с несколькими участниками со стороны клиента"""
+    stakeholders: List[Dict[str, str]]
+
+@dataclass
+class Report:
+    """Отчет по результатам переговоров"""
+    summary: str
+    strengths: List[str]
+    weaknesses: List[str]
+    recommendations: List[str]
+    growth_areas: List[str]
+    techniques_used: List[str]
+    missed_opportunities: List[str]
+    overall_rating: str
+
+def field_types(schema) -> Dict[str, Any]:
+    return {field.name: field.type for field in fields(schema)}
+
+def _normalize(value: Any, expected: Any) -> Any:
+    """Приводит значение к типу поля схемы; None если привести нельзя"""
+    if expected == List[Dict[str, str]]:
+        # Участники переговоров: словари с обязательной ролью
+        if not isinstance(value, list):
+            return None
+        items = [
+            {str(key): str(item_value).strip() for key, item_value in item.items()}
+            for item in value
+            if isinstance(item, dict) and str(item.get("role", "")).strip()
+        ]
+        return items or None
+    if expected is str:
+        if isinstance(value, (str, int, float)) and not isinstance(value, bool):
+            value = str(value).strip()
+            return value or None
+        if isinstance(value, list) and value:
+            return "; ".join(str(item) for item in value)
+        return None
+    # Списковые поля
+    if isinstance(value, str):
+        return [value] if value.strip() else None
+    if isinstance(value, list):
+        items = [str(item).strip() for item in value if str(item).strip()]
+        return items or None
+    return None
+
+def validate(data: Dict[str, Any], schema, required: List[str]) -> Tuple[Dict[str, Any], List[str]]:
+    """Проверяет поля ответа модели по схеме.
+
+    Возвращает приведенные к типам значения обязательных полей и список полей,
+    которых нет или которые не удалось привести.
+    """
+    types = field_types(schema)
+    valid, missing = {}, []
+    for name in required:
+        value = _normalize(data.get(name), types[name]) if name in data else None
+        if value is None:
+            missing.append(name)
+        else:
+            valid[name] = value
+    return valid, missing
@@ -0,0 +1,236 @@
+"""Хранилище тренировок и выгрузка неактивных сессий из памяти.
+
+Экспорт сохраненных диалогов для пакетной оценки:
+    python session_store.py sessions.db transcripts.jsonl
+"""
+import json
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+# Поля сессии, которые сохраняются в JSON
+JSON_FIELDS = ("situation", "report")
+SESSION_FIELDS = ("trainee", "situation", "summary", "summarized", "dialogue_ended", "report")
+
+class SessionStore:
+    """Интерфейс хранилища тренировок.
+
+    Сообщения диалога дописываются в журнал сессии по одному, остальное состояние
+    сессии сохраняется целиком при изменении.
+    """
+
+    def load(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """Сессия с сообщениями или None, если такой сессии нет"""
+        raise NotImplementedError
+
+    def save(self, session_id: str, **fields: Any) -> None:
+        """Сохраняет поля сессии из SESSION_FIELDS, создавая сессию при необходимости"""
+        raise NotImplementedError
+
+    def append_message(self, session_id: str, seq: int, message: Dict[str, str]) -> None:
+        """Дописывает сообщение с порядковым номером seq в журнал сессии"""
+        raise NotImplementedError
+
+    def sessions(self, updated_since: Optional[float] = None) -> Iterator[Dict[str, Any]]:
+        """Все сохраненные сессии с сообщениями"""
+        raise NotImplementedError
+
+class SQLiteSessionStore(SessionStore):
+    """Хранилище тренировок в SQLite"""
+
+    def __init__(self, path: str = "sessions.db"):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                "id TEXT PRIMARY KEY, trainee TEXT, situation TEXT, summary TEXT, summarized INTEGER DEFAULT 0, "
+                "dialogue_ended INTEGER DEFAULT 0, report TEXT, created REAL, updated REAL)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS messages ("
+                "session_id TEXT, seq INTEGER, role TEXT, speaker TEXT, content TEXT, created REAL, "
+                "PRIMARY KEY (session_id, seq))"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS sessions_updated ON sessions (updated)")
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(sessions)")}
+            if "trainee" not in columns:
+                # Хранилище, созданное до появления имени участника
+                self._conn.execute("ALTER TABLE sessions ADD COLUMN trainee TEXT")
+            message_columns = {row[1] for row in self._conn.execute("PRAGMA table_info(messages)")}
+            if "speaker" not in message_columns:
+                # Хранилище, созданное до групповых переговоров
+                self._conn.execute("ALTER TABLE messages ADD COLUMN speaker TEXT")
+
+    def _ensure(self, session_id: str, now: float) -> None:
+        self._conn.execute(
+            "INSERT OR IGNORE INTO sessions (id, created, updated) VALUES (?, ?, ?)", (session_id, now, now)
+        )
+
+    def load(self, session_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, trainee, situation, summary, summarized, dialogue_ended, report, created, updated "
+                "FROM sessions WHERE id = ?", (session_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            messages = self._messages(session_id)
+        return self._record(row, messages)
+
+    def save(self, session_id: str, **fields: Any) -> None:
+        unknown = set(fields) - set(SESSION_FIELDS)
+        if unknown:
+            raise ValueError(f"Неизвестные поля сессии: {', '.join(sorted(unknown))}")
+        values = {
+            name: json.dumps(value, ensure_ascii=False) if name in JSON_FIELDS and value is not None else value
+            for name, value in fields.items()
+        }
+        now = time.time()
+        with self._lock, self._conn:
+            self._ensure(session_id, now)
+            assignments = "".join(f"{name} = ?, " for name in values)
+            self._conn.execute(
+                f"UPDATE sessions SET {assignments}updated = ? WHERE id = ?",
+                (*values.values(), now, session_id)
+            )
+
+    def append_message(self, session_id: str, seq: int, message: Dict[str, str]) -> None:
+        now = time.time()
+        with self._lock, self._conn:
+            self._ensure(session_id, now)
+            # Повторная запись того же сообщения после перезапуска ничего не меняет
+            self._conn.execute(
+                "INSERT OR IGNORE INTO messages (session_id, seq, role, speaker, content, created) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (session_id, seq, message['role'], message.get('speaker'), message['content'], now)
+            )
+            self._conn.execute("UPDATE sessions SET updated = ? WHERE id = ?", (now, session_id))
+
+    def sessions(self, updated_since: Optional[float] = None) -> Iterator[Dict[str, Any]]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, trainee, situation, summary, summarized, dialogue_ended, report, created, updated "
+                "FROM sessions WHERE updated >= ? ORDER BY updated", (updated_since or 0,)
+            ).fetchall()
+        for row in rows:
+            with self._lock:
+                messages = self._messages(row[0])
+            yield self._record(row, messages)
+
+    def _messages(self, session_id: str) -> List[Dict[str, str]]:
+        rows = self._conn.execute(
+            "SELECT role, speaker, content FROM messages WHERE session_id = ? ORDER BY seq", (session_id,)
+        ).fetchall()
+        # Участник указывается только у реплик групповых переговоров
+        return [
+            {'role': role, 'speaker': speaker, 'content': content} if speaker else {'role': role, 'content': content}
+            for role, speaker, content in rows
+        ]
+
+    @staticmethod
+    def _record(row, messages: List[Dict[str, str]]) -> Dict[str, Any]:
+        session_id, trainee, situation, summary, summarized, dialogue_ended, report, created, updated = row
+        return {
+            "id": session_id,
+            "trainee": trainee,
+            "situation": json.loads(situation) if situation else None,
+            "messages": messages,
+            "summary": summary or "",
+            "summarized": summarized or 0,
+            "dialogue_ended": bool(dialogue_ended),
+            "report": json.loads(report) if report else None,
+            "created": created,
+            "updated": updated
+        }
+
+class ActiveSessions:
+    """Сессии, загруженные в память, с выгрузкой неактивных.
+
+    Сессия, к которой не обращались дольше idle_seconds, и самые давние сессии сверх
+    max_sessions выгружаются из памяти; при следующем обращении она снова загружается
+    через loader из хранилища. Загрузка идет вне общей блокировки, чтобы медленная
+    загрузка одной сессии не задерживала остальные; одновременные обращения к еще
+    не загруженной сессии ждут одну и ту же загрузку.
+    """
+
+    def __init__(self, loader: Callable[[str], Any], idle_seconds: float = 1800, max_sessions: int = 500):
+        self.loader = loader
+        self.idle_seconds = idle_seconds
+        self.max_sessions = max(1, max_sessions)
+        self._sessions: "OrderedDict[str, Any]" = OrderedDict()
+        self._accessed: Dict[str, float] = {}
+        self._loading: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    def get(self, session_id: str) -> Any:
+        with self._lock:
+            now = time.monotonic()
+            if session_id in self._sessions:
+                self._sessions.move_to_end(session_id)
+                self._accessed[session_id] = now
+                self._evict(now)
+                return self._sessions[session_id]
+            loading = self._loading.get(session_id)
+            if loading is None:
+                future = self._loading[session_id] = Future()
+        if loading is not None:
+            return loading.result()
+        try:
+            session = self.loader(session_id)
+        except BaseException as exc:
+            with self._lock:
+                del self._loading[session_id]
+            future.set_exception(exc)
+            raise
+        with self._lock:
+            del self._loading[session_id]
+            now = time.monotonic()
+            self._sessions[session_id] = session
+            self._accessed[session_id] = now
+            self._evict(now)
+        future.set_result(session)
+        return session
+
+    def discard(self, session_id: str) -> None:
+        with self._lock:
+            self._sessions.pop(session_id, None)
+            self._accessed.pop(session_id, None)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._sessions)
+
+    def _evict(self, now: float) -> None:
+        # Сессии упорядочены по последнему обращению, поэтому неактивные стоят в начале
+        while self._sessions:
+            session_id = next(iter(self._sessions))
+            if len(self._sessions) <= self.max_sessions and now - self._accessed[session_id] <= self.idle_seconds:
+                break
+            del self._sessions[session_id]
+            del self._accessed[session_id]
+
+def export_transcripts(store: SessionStore, output: str) -> int:
+    """Выгружает сохраненные диалоги в формате входного файла batch_eval.py"""
+    count = 0
+    with open(output, "w", encoding="utf-8") as f:
+        for session in store.sessions():
+            if not session["situation"] or not session["messages"]:
+                continue
+            f.write(json.dumps({
+                "id": session["id"],
+                "situation": session["situation"],
+                "conversation_history": session["messages"]
+            }, ensure_ascii=False) + "\n")
+            count += 1
+    return count
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        sys.exit("Использование: python session_store.py <sessions.db> <transcripts.jsonl>")
+    exported = export_transcripts(SQLiteSessionStore(sys.argv[1]), sys.argv[2])
+    print(f"Выгружено диалогов: {exported}")
@@ -0,0 +1,256 @@
+"""Симулятор тренировок: менеджер-бот против DialogueAgent.
+
+Пример:
+    python simulator.py --sessions 20 --concurrency 5 --llm fake_llm:FakeChatModel
+    python simulator.py --sessions 3 --manager llm --output simulation.json
+    python simulator.py --sessions 10 --stakeholders 3 --llm fake_llm:FakeChatModel
+
+Прогоняет полный цикл - ситуация, диалог до срабатывания детектора завершения или
+лимита ходов, отчет - и собирает задержки по этапам, расход токенов и число ходов.
+"""
+import argparse
+import json
+import sys
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+
+from langchain_core.messages import HumanMessage, SystemMessage
+
+from batch_eval import load_llm, percentile
+from conversation import ConversationState
+from instrumentation import token_usage
+from agents import DialogueAgent, GroupDialogueAgent, ReportGenerator, SituationGenerator, new_end_detector
+
+# Этапы тренировки; модель каждого берется по маршруту одноименного агента, как в приложении
+STAGES = ("situation", "client", "end_check", "report", "manager")
+
+# Реплики менеджера для сценарного режима
+MANAGER_SCRIPT = [
+    "Добрый день! Хочу рассказать, как наше решение поможет вашей компании.",
+    "Понимаю ваши сомнения. Какие задачи для вас сейчас самые важные?",
+    "Наши клиенты окупают вложения в среднем за восемь месяцев, могу показать расчеты.",
+    "Можем начать с пилотного проекта на одном отделе, чтобы вы оценили результат.",
+    "Готов зафиксировать цену на год и включить внедрение в стоимость.",
+    "Давайте договоримся о пилоте и подпишем договор на первый этап?"
+]
+
+class StageStats:
+    """Потокобезопасный сбор задержек и токенов по этапам"""
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.tokens: Dict[str, Dict[str, int]] = defaultdict(lambda: {"prompt": 0, "completion": 0})
+        self._lock = threading.Lock()
+
+    def record(self, stage: str, latency: float, usage: Dict[str, int]) -> None:
+        with self._lock:
+            self.latencies[stage].append(latency)
+            for key, value in usage.items():
+                self.tokens[stage][key] += value
+
+    def merge(self, other: "StageStats") -> None:
+        with self._lock:
+            for stage, values in other.latencies.items():
+                self.latencies[stage].extend(values)
+            for stage, usage in other.tokens.items():
+                for key, value in usage.items():
+                    self.tokens[stage][key] += value
+
+class RecordingLLM:
+    """Обертка над моделью, записывающая задержку и токены каждого вызова этапа"""
+
+    def __init__(self, llm, stage: str, stats: StageStats):
+        self.llm = llm
+        self.stage = stage
+        self.stats = stats
+
+    def invoke(self, messages, **kwargs: Any):
+        started = time.perf_counter()
+        response = self.llm.invoke(messages, **kwargs)
+        self.stats.record(self.stage, time.perf_counter() - started, token_usage(response))
+        return response
+
+    async def ainvoke(self, messages, **kwargs: Any):
+        started = time.perf_counter()
+        response = await self.llm.ainvoke(messages, **kwargs)
+        self.stats.record(self.stage, time.perf_counter() - started, token_usage(response))
+        return response
+
+    def stream(self, messages, **kwargs: Any) -> Iterator[Any]:
+        started = time.perf_counter()
+        usage = {"prompt": 0, "completion": 0}
+        for chunk in self.llm.stream(messages, **kwargs):
+            for key, value in token_usage(chunk).items():
+                usage[key] += value
+            yield chunk
+        self.stats.record(self.stage, time.perf_counter() - started, usage)
+
+    async def astream(self, messages, **kwargs: Any) -> AsyncIterator[Any]:
+        started = time.perf_counter()
+        usage = {"prompt": 0, "completion": 0}
+        async for chunk in self.llm.astream(messages, **kwargs):
+            for key, value in token_usage(chunk).items():
+                usage[key] += value
+            yield chunk
+        self.stats.record(self.stage, time.perf_counter() - started, usage)
+
+class ScriptedManager:
+    """Менеджер, отвечающий заранее заготовленными репликами"""
+
+    def __init__(self, script: Optional[List[str]] = None):
+        self.script = script or MANAGER_SCRIPT
+
+    def next_message(self, conversation_history: ConversationState) -> str:
+        turn = sum(1 for msg in conversation_history if msg['role'] == 'manager')
+        return self.script[min(turn, len(self.script) - 1)]
+
+class LLMManager:
+    """Менеджер, реплики которого генерирует модель"""
+
+    def __init__(self, llm, situation: Dict[str, str]):
+        self.llm = llm
+        self.situation = situation
+
+    def next_message(self, conversation_history: ConversationState) -> str:
+        system_prompt = f"""
+        Ты играешь роль менеджера в переговорах. Твоя роль: {self.situation['manager_role']}.
+        Ситуация: {self.situation['situation']}
+        Твоя цель: {self.situation['manager_goal']}
+        Продукт: {self.situation['product']}
+
+        Веди переговоры профессионально, работай с возражениями клиента и добивайся цели.
+        Отвечай кратко, одной репликой.
+        """
+
+        user_prompt = f"""
+        История диалога:
+        {conversation_history.context() or "Диалог еще не начат"}
+
+        Напиши следующую реплику менеджера.
+        """
+
+        messages = [
+            SystemMessage(content=system_prompt),
+            HumanMessage(content=user_prompt)
+        ]
+
+        response = self.llm.invoke(messages)
+        return response.content.strip()
+
+def load_stage_llms(spec: str, session_id: str = "simulator") -> Dict[str, Any]:
+    """Модели этапов симуляции по маршрутам агентов"""
+    return {stage: load_llm(spec, session_id, stage) for stage in STAGES}
+
+def simulate_session(llms: Dict[str, Any], situation: Dict[str, str], manager: str = "scripted",
+                     max_turns: int = 12) -> Dict[str, Any]:
+    """Проводит одну тренировку от начала до отчета и возвращает ее статистику"""
+    stats = StageStats()
+    started = time.perf_counter()
+    conversation = ConversationState()
+    if situation.get("stakeholders"):
+        dialogue_agent = GroupDialogueAgent(RecordingLLM(llms["client"], "client", stats), situation)
+    else:
+        dialogue_agent = DialogueAgent(RecordingLLM(llms["client"], "client", stats), situation)
+    # Решения по синтетическим диалогам не должны попадать в обучающие данные классификатора
+    end_detector = new_end_detector(RecordingLLM(llms["end_check"], "end_check", stats), situation, log_decisions=False)
+    report_generator = ReportGenerator(RecordingLLM(llms["report"], "report", stats), situation)
+    if manager == "llm":
+        manager_agent = LLMManager(RecordingLLM(llms["manager"], "manager", stats), situation)
+    else:
+        manager_agent = ScriptedManager()
+
+    ended_by = "turn_cap"
+    turns = 0
+    while turns < max_turns:
+        turns += 1
+        conversation.append({'role': 'manager', 'content': manager_agent.next_message(conversation)})
+        if isinstance(dialogue_agent, GroupDialogueAgent):
+            conversation.extend(dialogue_agent.respond(conversation))
+        else:
+            conversation.append({'role': 'client', 'content': dialogue_agent.respond_as_client(conversation)})
+        should_end = end_detector.should_end_dialogue(conversation)
+        if should_end:
+            ended_by = "detector"
+            break
+
+    try:
+        rating, report_error = report_generator.generate_report(conversation).get("overall_rating"), None
+    except Exception as exc:
+        # Неполный отчет не подменяется оценкой по умолчанию - тренировка учитывается без оценки
+        rating, report_error = None, str(exc)
+    return {
+        "turns": turns,
+        "ended_by": ended_by,
+        "rating": rating,
+        "report_error": report_error,
+        "end_check_skip_rate": end_detector.skip_rate,
+        "total_seconds": time.perf_counter() - started,
+        "stats": stats
+    }
+
+def run_simulation(llms: Dict[str, Any], sessions: int = 10, concurrency: int = 4, manager: str = "scripted",
+                   max_turns: int = 12, stakeholders: int = 0) -> Dict[str, Any]:
+    """Генерирует ситуацию и прогоняет по ней несколько параллельных тренировок"""
+    stats = StageStats()
+    started = time.perf_counter()
+    situation = SituationGenerator(RecordingLLM(llms["situation"], "situation", stats), stakeholders).generate_situation()
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(
+            lambda _: simulate_session(llms, situation, manager, max_turns), range(sessions)
+        ))
+    elapsed = time.perf_counter() - started
+
+    for result in results:
+        stats.merge(result.pop("stats"))
+    turns = [result["turns"] for result in results]
+    session_seconds = [result["total_seconds"] for result in results]
+    return {
+        "sessions": sessions,
+        "concurrency": concurrency,
+        "elapsed_seconds": round(elapsed, 2),
+        "sessions_per_minute": round(sessions / elapsed * 60, 2) if elapsed else 0.0,
+        "turns_mean": round(sum(turns) / len(turns), 2) if turns else 0.0,
+        "turns_p95": percentile(turns, 95),
+        "completed_by_detector": sum(result["ended_by"] == "detector" for result in results),
+        "session_seconds_p50": round(percentile(session_seconds, 50), 3),
+        "session_seconds_p95": round(percentile(session_seconds, 95), 3),
+        "stages": {
+            stage: {
+                "calls": len(latencies),
+                "latency_p50": round(percentile(latencies, 50), 3),
+                "latency_p95": round(percentile(latencies, 95), 3),
+                "prompt_tokens": stats.tokens[stage]["prompt"],
+                "completion_tokens": stats.tokens[stage]["completion"]
+            }
+            for stage, latencies in stats.latencies.items()
+        },
+        "sessions_detail": results
+    }
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Симуляция тренировок для нагрузочного и качественного тестирования")
+    parser.add_argument("--sessions", type=int, default=10, help="число тренировок")
+    parser.add_argument("--concurrency", type=int, default=4, help="сколько тренировок идет одновременно")
+    parser.add_argument("--max-turns", type=int, default=12, help="лимит ходов менеджера")
+    parser.add_argument("--manager", choices=["scripted", "llm"], default="scripted", help="кто играет менеджера")
+    parser.add_argument("--stakeholders", type=int, default=0,
+                        help="число участников со стороны клиента для групповых переговоров (0 - один клиент)")
+    parser.add_argument("--llm", default="gigachat", help='"gigachat" или "module:factory"')
+    parser.add_argument("--output", help="сохранить результаты в JSON")
+    args = parser.parse_args(argv)
+
+    summary = run_simulation(load_stage_llms(args.llm), args.sessions, args.concurrency, args.manager,
+                             args.max_turns, args.stakeholders)
+    text = json.dumps(summary, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        sys.stdout.write(text + "\n")
+
+if __name__ == "__main__":
+    main()
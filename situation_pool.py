@@ -0,0 +1,128 @@
+import json
+import re
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional, Set
+
+# Поля ситуации, по которым сравниваются сценарии при дедупликации
+FINGERPRINT_FIELDS = ('situation', 'product', 'client_role', 'client_concerns')
+
+def situation_fingerprint(situation: Dict[str, str]) -> str:
+    """Нормализованный набор слов ситуации для сравнения сценариев"""
+    text = " ".join(str(situation.get(field, "")) for field in FINGERPRINT_FIELDS)
+    words = sorted(set(re.findall(r'\w{3,}', text.lower())))
+    return " ".join(words)
+
+def _similarity(a: Set[str], b: Set[str]) -> float:
+    """Коэффициент Жаккара для двух наборов слов"""
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+class SituationPool:
+    """Пул заранее сгенерированных ситуаций с фоновым пополнением.
+
+    Ситуации хранятся в SQLite и переживают перезапуск приложения. Фоновый поток
+    поддерживает в пуле заданное количество ситуаций и отбрасывает сценарии, слишком
+    похожие на уже лежащие в пуле или недавно выданные.
+    """
+
+    def __init__(self, generator, path: str = "situation_pool.db", size: int = 5,
+                 similarity_threshold: float = 0.6, served_history: int = 200):
+        self.generator = generator
+        self.size = size
+        self.similarity_threshold = similarity_threshold
+        self.served_history = served_history
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS situations ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, fingerprint TEXT, data TEXT, created REAL)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS served ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, fingerprint TEXT, served REAL)"
+            )
+
+    def start(self) -> "SituationPool":
+        """Запускает фоновое пополнение пула"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._worker, name="situation-pool", daemon=True)
+            self._thread.start()
+        return self
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM situations").fetchone()[0]
+
+    def pop(self) -> Optional[Dict[str, str]]:
+        """Забирает готовую ситуацию из пула, None если пул пуст"""
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT id, fingerprint, data FROM situations ORDER BY id LIMIT 1"
+            ).fetchone()
+            if row is None:
+                situation = None
+            else:
+                situation_id, fingerprint, data = row
+                self._conn.execute("DELETE FROM situations WHERE id = ?", (situation_id,))
+                self._remember_served(fingerprint)
+                situation = json.loads(data)
+        self._wakeup.set()
+        return situation
+
+    def mark_served(self, situation: Dict[str, str]) -> None:
+        """Запоминает ситуацию, сгенерированную в обход пула, для дедупликации"""
+        with self._lock, self._conn:
+            self._remember_served(situation_fingerprint(situation))
+
+    def add(self, situation: Dict[str, str]) -> bool:
+        """Кладет ситуацию в пул, если она не повторяет уже известные"""
+        fingerprint = situation_fingerprint(situation)
+        with self._lock, self._conn:
+            if self._is_duplicate(fingerprint):
+                return False
+            self._conn.execute(
+                "INSERT INTO situations (fingerprint, data, created) VALUES (?, ?, ?)",
+                (fingerprint, json.dumps(situation, ensure_ascii=False), time.time())
+            )
+        return True
+
+    def _remember_served(self, fingerprint: str) -> None:
+        self._conn.execute(
+            "INSERT INTO served (fingerprint, served) VALUES (?, ?)", (fingerprint, time.time())
+        )
+        self._conn.execute(
+            "DELETE FROM served WHERE id NOT IN (SELECT id FROM served ORDER BY id DESC LIMIT ?)",
+            (self.served_history,)
+        )
+
+    def _is_duplicate(self, fingerprint: str) -> bool:
+        words = set(fingerprint.split())
+        known = self._conn.execute(
+            "SELECT fingerprint FROM situations UNION ALL SELECT fingerprint FROM served"
+        ).fetchall()
+        return any(
+            _similarity(words, set(other.split())) >= self.similarity_threshold
+            for (other,) in known
+        )
+
+    def _worker(self) -> None:
+        failures = 0
+        while True:
+            if len(self) >= self.size:
+                self._wakeup.wait()
+                self._wakeup.clear()
+                continue
+            try:
+                added = self.add(self.generator.generate_situation())
+            except Exception:
+                added = False
+            # Повторы и ошибки подряд означают, что генерация буксует - притормаживаем
+            failures = 0 if added else failures + 1
+            if failures:
+                time.sleep(min(60, 2 ** failures))
@@ -0,0 +1,67 @@
+import pytest
+
+from end_rules import RuleClassifier, last_exchange
+
+# Порог уверенности, выше которого детектор завершает диалог без модели
+CONFIDENCE_THRESHOLD = 0.8
+
+def classify(text):
+    return RuleClassifier().classify([
+        {'role': 'manager', 'content': 'Что скажете о нашем предложении?'},
+        {'role': 'client', 'content': text}
+    ])
+
+@pytest.mark.parametrize("text", [
+    "Не могу сказать, что согласен",
+    "Я согласен с вами только частично",
+    "не совсем согласен",
+    "Согласен, что дорого",
+    "Не интересны ваши обещания. Покажите кейсы.",
+    "Ваше предложение нам не интересно без скидки",
+    "Давайте начнем с обсуждения цены",
+    "Мы пока не договорились",
+])
+def test_not_final_reply_is_left_to_model(text):
+    decision, confidence = classify(text)
+    assert not decision or confidence < CONFIDENCE_THRESHOLD
+
+@pytest.mark.parametrize("text", [
+    "Договорились, присылайте договор.",
+    "Согласен, подписываем!",
+    "Берём, давайте начнем работать.",
+    "Вы меня убедили",
+])
+def test_final_agreement_ends_dialogue(text):
+    assert classify(text) == (True, 0.9)
+
+@pytest.mark.parametrize("text", [
+    "Нет, спасибо. Нам это не нужно.",
+    "Нам это не интересно. Всего доброго.",
+    "Мы выбрали другого поставщика.",
+])
+def test_final_refusal_ends_dialogue(text):
+    assert classify(text) == (True, 0.9)
+
+GROUP_ROUND = [
+    {'role': 'manager', 'content': 'Готовы начать?'},
+    {'role': 'client', 'speaker': 'Финансовый директор', 'content': 'Это слишком дорого, какие гарантии?'},
+    {'role': 'manager', 'content': 'Зафиксируем цену на год.'},
+    {'role': 'client', 'speaker': 'Технический директор', 'content': 'Нас не устраивают сроки внедрения.'},
+    {'role': 'client', 'speaker': 'Руководитель закупок', 'content': 'Присылайте договор.'},
+]
+
+def test_group_round_ends_only_on_consensus():
+    decision, confidence = RuleClassifier().classify(GROUP_ROUND)
+    assert not decision or confidence < CONFIDENCE_THRESHOLD
+    agreed = GROUP_ROUND[:3] + [
+        {'role': 'client', 'speaker': 'Технический директор', 'content': 'Договорились.'},
+        {'role': 'client', 'speaker': 'Руководитель закупок', 'content': 'Присылайте договор.'},
+    ]
+    assert RuleClassifier().classify(agreed) == (True, 0.9)
+
+def test_last_exchange_covers_whole_round():
+    assert last_exchange(GROUP_ROUND) == (
+        "Менеджер: Зафиксируем цену на год.\n"
+        "Клиент: Нас не устраивают сроки внедрения.\n"
+        "Клиент: Присылайте договор."
+    )